@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Accounts that share full-profile requests of one dump. """
+
+import logging
+from telethon import types, utils
+from telethon.errors import RPCError
+from telegram_users_dump.participants import ParticipantEnumerator
+
+
+class Account:
+    """ A logged in client with its own rate limiter.
+
+        Flood limits apply per account, so every account schedules its requests
+        independently. Access hashes of users are per account as well: the primary
+        account requests users by the objects its participants listing returns,
+        other (worker) accounts list the chat themselves to learn their own hashes.
+    """
+
+    def __init__(self, client, rate_limiter, name, is_primary=False):
+        """ constructor
+            :param client:       Connected TelegramClient of the account
+            :param rate_limiter: RateLimiter of the account
+            :param name:         Name of the account in stats. E.g. its phone number
+            :param is_primary:   Whether the account lists the participants being dumped
+        """
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.name = name
+        self.is_primary = is_primary
+        # Number of requests of the account in flight
+        self.in_flight = 0
+        self.requests_count = 0
+        # User id -> access hash valid for this account. Filled by `load_access_hashes()`
+        self._access_hashes = {}
+
+    def input_user(self, user):
+        """ Returns the object to request user's full profile by, or None
+            if the account doesn't know the user (yet).
+            :param user: telethon.tl.types.User object listed by the primary account
+        """
+        if self.is_primary:
+            return user
+        access_hash = self._access_hashes.get(user.id)
+        if access_hash is None:
+            return None
+        return types.InputUser(user.id, access_hash)
+
+    async def load_access_hashes(self, channel, concurrency=1):
+        """ Lists participants of the chat to learn access hashes of this account.
+            Users become available for fetching as they are listed.
+            :param channel: Chat/Channel entity resolved by the primary account
+        """
+        if self.is_primary:
+            return
+        try:
+            peer = await self._resolve(channel)
+            if peer is None:
+                self.logger.warning('Account %s has no access to the chat. It stays idle.',
+                                    self.name)
+                return
+            enumerator = ParticipantEnumerator(self.client, self.rate_limiter, concurrency)
+            async for user in enumerator.enumerate(peer):
+                if user.access_hash is not None:
+                    self._access_hashes[user.id] = user.access_hash
+        except (RPCError, ValueError) as ex:
+            self.logger.warning('Account %s failed to list the chat. %s', self.name, ex)
+        self.logger.debug('Account %s knows %s participants.', self.name, len(self._access_hashes))
+
+    async def _resolve(self, channel):
+        """ Finds the chat among entities available to this account """
+        username = getattr(channel, 'username', None)
+        if username:
+            return await self.client.get_input_entity(username)
+        peer_id = utils.get_peer_id(channel)
+        async for dialog in self.client.iter_dialogs():
+            if dialog.id == peer_id:
+                return dialog.entity
+        return None
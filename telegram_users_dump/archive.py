@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Append-only archive of fetched profiles, re-exported offline.
+
+    File layout:
+        header   MAGIC, codec byte: b'm' (msgpack) or b'j' (json)
+        records  <uint32 length><payload>, payload is an encoded list of UserRecord fields
+        footer   index entries <uint64 offset><uint32 count>, <uint32 number of entries>,
+                 INDEX_MAGIC
+
+    The footer is written when a dump is committed. A continued dump cuts it off,
+    appends records and writes a new one. Archives without a footer (e.g. of an
+    interrupted dump) are indexed by scanning the length prefixes.
+"""
+
+import os
+import json
+import struct
+from telegram_users_dump.user_record import UserRecord
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC = b'TUDARCH1'
+INDEX_MAGIC = b'TUDAIDX1'
+HEADER_SIZE = len(MAGIC) + 1
+
+# Number of records in one indexed chunk, the unit of parallel re-export
+CHUNK_SIZE = 20000
+
+_LENGTH = struct.Struct('<I')
+_INDEX_ENTRY = struct.Struct('<QI')
+
+
+def encode(record):
+    """ Serializes a UserRecord into a length-prefixed archive record """
+    fields = [getattr(record, name) for name in UserRecord.__slots__]
+    if msgpack is not None:
+        payload = msgpack.packb(fields)
+    else:
+        payload = json.dumps(fields, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def header():
+    """ Returns the header of a new archive written with the available codec """
+    return MAGIC + (b'm' if msgpack is not None else b'j')
+
+
+def footer(index):
+    """ Returns the footer of an archive
+        :param index: list of (offset, count) tuples of chunks
+    """
+    return b''.join(_INDEX_ENTRY.pack(*entry) for entry in index) \
+        + _LENGTH.pack(len(index)) + INDEX_MAGIC
+
+
+def scan(archive_file, start, end=None):
+    """ Indexes records by following their length prefixes.
+        A torn record at the end (of an interrupted write) is ignored.
+        :param archive_file: Archive opened in binary mode
+        :param start:        Offset of the first record
+        :param end:          Offset the records end at. (Default: end of file)
+
+        :return: (list of (offset, count) tuples, offset the valid records end at)
+    """
+    if end is None:
+        end = archive_file.seek(0, os.SEEK_END)
+    index = []
+    pos = start
+    count = 0
+    archive_file.seek(pos)
+    while pos + _LENGTH.size <= end:
+        prefix = archive_file.read(_LENGTH.size)
+        if len(prefix) < _LENGTH.size:
+            break
+        next_pos = pos + _LENGTH.size + _LENGTH.unpack(prefix)[0]
+        if next_pos > end:
+            break
+        if count == 0:
+            index.append([pos, 0])
+        count += 1
+        if count == CHUNK_SIZE:
+            index[-1][1] = count
+            count = 0
+        archive_file.seek(next_pos)
+        pos = next_pos
+    if count:
+        index[-1][1] = count
+    return [tuple(entry) for entry in index], pos
+
+
+class ArchiveReader:
+    """ Reads an archive chunk by chunk. """
+
+    def __init__(self, path):
+        """ constructor
+            :param path: Path of the archive
+
+            :raises ValueError: if the file isn't an archive or can't be decoded here
+            :raises OSError:    if the file can't be read
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            magic = self._file.read(HEADER_SIZE)
+            if len(magic) < HEADER_SIZE or magic[:len(MAGIC)] != MAGIC:
+                raise ValueError('"{}" is not an archive of profiles.'.format(path))
+            self.codec = magic[-1:]
+            if self.codec == b'm' and msgpack is None:
+                raise ValueError('Archive "{}" is encoded with msgpack. '
+                                 'Install msgpack package to read it.'.format(path))
+            if self.codec not in (b'm', b'j'):
+                raise ValueError('Archive "{}" has unknown encoding.'.format(path))
+            # list of (start offset, end offset, number of records) tuples
+            self.chunks = self._load_index()
+        except BaseException:
+            self._file.close()
+            raise
+
+    @property
+    def count(self):
+        """ Number of records in the archive """
+        return sum(count for _, _, count in self.chunks)
+
+    def records(self, start, end):
+        """ Decodes records of a chunk
+            :param start: Offset of the first record of the chunk
+            :param end:   Offset the chunk ends at
+
+            :return: list of UserRecord objects
+        """
+        self._file.seek(start)
+        data = self._file.read(end - start)
+        if self.codec == b'm':
+            decode = msgpack.unpackb
+        else:
+            decode = json.loads
+        records = []
+        pos = 0
+        unpack_length = _LENGTH.unpack_from
+        length_size = _LENGTH.size
+        while pos < len(data):
+            length = unpack_length(data, pos)[0]
+            pos += length_size
+            records.append(UserRecord(*decode(data[pos:pos + length])))
+            pos += length
+        return records
+
+    def __iter__(self):
+        for start, end, _ in self.chunks:
+            yield from self.records(start, end)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _load_index(self):
+        """ Reads the footer index or scans the records if there is none """
+        size = self._file.seek(0, os.SEEK_END)
+        data_end = None
+        index = None
+        if size >= HEADER_SIZE + _LENGTH.size + len(INDEX_MAGIC):
+            self._file.seek(size - _LENGTH.size - len(INDEX_MAGIC))
+            tail = self._file.read()
+            if tail.endswith(INDEX_MAGIC):
+                entries_count = _LENGTH.unpack_from(tail)[0]
+                data_end = size - len(tail) - entries_count * _INDEX_ENTRY.size
+                if data_end >= HEADER_SIZE:
+                    self._file.seek(data_end)
+                    index = [entry for entry in _INDEX_ENTRY.iter_unpack(
+                        self._file.read(entries_count * _INDEX_ENTRY.size))]
+                # A record that happens to end with the magic bytes
+                if not _is_valid_index(index, data_end):
+                    index = None
+        if index is None:
+            index, data_end = scan(self._file, HEADER_SIZE, size)
+        ends = [offset for offset, _ in index[1:]] + [data_end]
+        return [(offset, end, count) for (offset, count), end in zip(index, ends)]
+
+
+def _is_valid_index(index, data_end):
+    if index is None:
+        return False
+    if not index:
+        return data_end == HEADER_SIZE
+    offsets = [offset for offset, _ in index]
+    return offsets[0] == HEADER_SIZE and offsets == sorted(offsets) and offsets[-1] < data_end
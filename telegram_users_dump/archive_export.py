@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Offline re-export of an archive written by 'archive' exporter. """
+
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from telegram_users_dump import exporters
+from telegram_users_dump.archive import ArchiveReader
+from telegram_users_dump.exceptions import DumpingError
+from telegram_users_dump.exporter_context import ExporterContext
+from telegram_users_dump.output_writer import OutputWriter
+from telegram_users_dump.pattern_filter import PatternFilter
+from telegram_users_dump.progress_bar import ProgressBar
+from telegram_users_dump.utils import sprint
+
+# Filter, exporter and archive of the current worker process. Set by `_init_worker`
+_worker = None
+
+
+class ArchiveExporter:
+    """ Filters and formats archived profiles without touching the network.
+
+        Chunks of the archive are filtered and formatted by a pool of worker
+        processes (or in process with a single job) and the results are written
+        in the archive order. A user archived twice, e.g. by a dump continued
+        after a crash, is written once.
+    """
+
+    def __init__(self, settings, exporter):
+        """ constructor
+            :param settings: ExportSettings object
+            :param exporter: Exporter object the archive is re-exported with
+        """
+        self.logger = logging.getLogger(__name__)
+        self.settings = settings
+        self.exporter = exporter
+
+    def run(self):
+        """ Re-exports the archive.
+            :return: Number of users written
+        """
+        try:
+            pattern_filter = PatternFilter.from_settings(self.settings)
+        except OSError as ex:
+            raise DumpingError('Failed to read patterns file "{}". {}'.format(
+                self.settings.patterns_file, ex.strerror))
+        try:
+            with ArchiveReader(self.settings.archive) as reader:
+                chunks = reader.chunks
+                records_count = reader.count
+        except (OSError, ValueError) as ex:
+            raise DumpingError('Failed to read archive "{}". {}'.format(
+                self.settings.archive, getattr(ex, 'strerror', None) or ex))
+        sprint('Archived users total: {}'.format(records_count))
+
+        exporter_context = ExporterContext()
+        exporter_context.has_matches_column = pattern_filter.is_multi_pattern
+        writer = OutputWriter(self.settings.out_file, self.exporter, exporter_context)
+        try:
+            writer.open()
+        except OSError as ex:
+            raise DumpingError('Output file path "{}" is invalid. {}'.format(
+                self.settings.out_file, ex.strerror))
+        sprint('Exporting into "{}" file ...'.format(self.settings.out_file))
+
+        # Workers create exporters of their own: this one is bound to the output file
+        # and can't be pickled for processes that are spawned rather than forked
+        worker_args = (self.settings,)
+        processed = 0
+        found = 0
+        written_ids = set()
+        bar = ProgressBar("Processed users", records_count)
+        bar.startProgress()
+        try:
+            for chunk_count, rows in self._export_chunks(chunks, worker_args):
+                for user_id, row in rows:
+                    if user_id not in written_ids:
+                        written_ids.add(user_id)
+                        writer.write(row)
+                        found += 1
+                processed += chunk_count
+                bar.progress(processed, found)
+        finally:
+            try:
+                writer.commit()
+            except OSError as ex:
+                raise DumpingError("Exporting to a final file failed.") from ex
+        bar.endProgress(found)
+        return found
+
+    def _export_chunks(self, chunks, worker_args):
+        """ Filters and formats chunks, in a process pool if there are several jobs.
+            :return: Iterator of (number of records, [(user id, row)]) of the chunks in order
+        """
+        if self.settings.jobs == 1 or len(chunks) < 2:
+            _init_worker(*worker_args)
+            try:
+                for start, end, count in chunks:
+                    yield count, _export_chunk(start, end)
+            finally:
+                _worker[0].close()
+            return
+        with ProcessPoolExecutor(self.settings.jobs, initializer=_init_worker,
+                                 initargs=worker_args) as pool:
+            # Keep a couple of chunks per worker queued, not the whole archive in memory
+            pending = deque()
+            for start, end, count in chunks:
+                pending.append((count, pool.submit(_export_chunk, start, end)))
+                if len(pending) >= 2 * self.settings.jobs:
+                    count, future = pending.popleft()
+                    yield count, future.result()
+            while pending:
+                count, future = pending.popleft()
+                yield count, future.result()
+
+
+def _init_worker(settings):
+    """ Sets up a worker process. Arguments are pickled, so the filter is compiled
+        and the exporter chosen by settings is created here. The exporter is never
+        given a file, it only formats rows.
+    """
+    global _worker  # pylint: disable=global-statement
+    exporter = exporters.create(settings.exporter)
+    if hasattr(exporter, 'configure'):
+        exporter.configure(settings)
+    pattern_filter = PatternFilter.from_settings(settings)
+    exporter_context = ExporterContext()
+    exporter_context.has_matches_column = pattern_filter.is_multi_pattern
+    _worker = (ArchiveReader(settings.archive), pattern_filter, exporter, exporter_context)
+
+
+def _export_chunk(start, end):
+    """ Filters and formats the records of a chunk
+        :return: list of (user id, formatted row) tuples of users that passed the filter
+    """
+    reader, pattern_filter, exporter, exporter_context = _worker
+    rows = []
+    for record in reader.records(start, end):
+        matched_patterns = pattern_filter.match(record)
+        if matched_patterns is None:
+            continue
+        exporter_context.matched_patterns = matched_patterns
+        rows.append((record.id, exporter.format(record, exporter_context)))
+    return rows
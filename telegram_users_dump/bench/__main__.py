@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Runs the dumper against a fake Telegram backend and reports throughput.
+
+Usage:
+python -m telegram_users_dump.bench [--users N] [--latency SEC] [--flood-rate X] [--json FILE]
+
+Results are printed as one JSON line. With --json they are also appended
+to a file, so that runs can be compared to track regressions.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+from telegram_users_dump import run
+from telegram_users_dump.chat_dump_settings import ChatDumpSettings
+from telegram_users_dump.bench.fake_backend import FakeTelegramBackend, BenchDumper
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m telegram_users_dump.bench')
+    parser.add_argument('--users', default=2000, type=int)
+    parser.add_argument('--latency', default=0.05, type=float)
+    parser.add_argument('--jitter', default=0.5, type=float)
+    parser.add_argument('--flood-rate', default=0.0, type=float)
+    parser.add_argument('--flood-seconds', default=1, type=int)
+    parser.add_argument('--bio-size', default=70, type=int)
+    parser.add_argument('--listing-cap', default=10000, type=int)
+    parser.add_argument('--concurrency', default=16, type=int)
+    parser.add_argument('--max-rate', default=1000.0, type=float)
+    parser.add_argument('-f', '--filter', default='.*', type=str)
+    parser.add_argument('-e', '--exp', default='csv', type=str)
+    parser.add_argument('--json', default='', type=str)
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    line = json.dumps(result, sort_keys=True)
+    print(line)
+    if args.json:
+        with open(args.json, 'a', encoding='utf-8') as results_file:
+            print(line, file=results_file)
+
+
+def run_benchmark(args):
+    """ Runs one dump against the fake backend.
+        :return: dict of measured metrics
+    """
+    backend = FakeTelegramBackend(
+        users_count=args.users, latency=args.latency, jitter=args.jitter,
+        flood_rate=args.flood_rate, flood_seconds=args.flood_seconds,
+        bio_size=args.bio_size, listing_cap=args.listing_cap)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        out_file = os.path.join(temp_dir, 'bench')
+        settings = ChatDumpSettings(run.__doc__, [
+            '-c', 'bench', '-p', '1', '-o', out_file, '-f', args.filter,
+            '-e', args.exp, '--concurrency', str(args.concurrency),
+            '--max-rate', str(args.max_rate)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            exporter = run._create_exporter(settings)
+            for target in settings.chats:
+                target.out_file += exporter.ext
+            dumper = BenchDumper(backend, settings, exporter)
+            started = time.perf_counter()
+            ret_code = dumper.run()
+            elapsed = time.perf_counter() - started
+        out_size = os.path.getsize(settings.chats[0].out_file)
+
+    latencies = sorted(backend.user_latencies)
+    return {
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'latency': args.latency,
+        'flood_rate': args.flood_rate,
+        'bio_size': args.bio_size,
+        'exporter': args.exp,
+        'ret_code': ret_code,
+        'elapsed_sec': round(elapsed, 3),
+        'users_per_sec': round(args.users / elapsed, 1),
+        'user_latency_p50_sec': round(_percentile(latencies, 50), 4),
+        'user_latency_p99_sec': round(_percentile(latencies, 99), 4),
+        'flood_waits': backend.flood_waits_count,
+        'requests': backend.requests_count,
+        'written_users': dumper.output_total_count,
+        'output_bytes': out_size,
+        'output_bytes_per_sec': round(out_size / elapsed, 1),
+        'peak_rss_kb': _peak_rss_kb(),
+        'python': platform.python_version(),
+        # Time spent per request type and pipeline stage, see metrics.py
+        'stages': dumper.metrics.summary()['histograms'],
+    }
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Micro-benchmark of exporters' format() method.
+
+Usage:
+python -m telegram_users_dump.bench.exporters [--rows N] [--bio-size N] [--json FILE]
+
+Compares exporters against their original regex-callback escaping,
+which is kept here as a reference, and checks the output is byte-identical.
+Then measures the whole write path of 'csv' and 'stdcsv' exporters
+and checks that 'stdcsv' output reads back into the original fields.
+"""
+
+import io
+import re
+import csv
+import json
+import time
+import argparse
+from telegram_users_dump import exporters
+from telegram_users_dump.exporter_context import ExporterContext
+from telegram_users_dump.user_record import UserRecord
+from telegram_users_dump.exporters.common import common
+from telegram_users_dump.utils import ein, uin, quoted_if_has_comma
+from telegram_users_dump.bench.fake_backend import FakeTelegramBackend
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m telegram_users_dump.bench.exporters')
+    parser.add_argument('--rows', default=100000, type=int)
+    parser.add_argument('--bio-size', default=70, type=int)
+    parser.add_argument('--repeat', default=3, type=int)
+    parser.add_argument('--json', default='', type=str)
+    args = parser.parse_args()
+
+    backend = FakeTelegramBackend(users_count=args.rows, bio_size=args.bio_size)
+    full_users = [UserRecord.from_full(full) for full in backend.full_users()]
+    context = ExporterContext()
+
+    for name, reference in (('csv', _reference_csv_format), ('text', _reference_text_format)):
+        exporter = exporters.create(name)
+        expected = [reference(full) for full in full_users]
+        actual = [exporter.format(full, context) for full in full_users]
+        if actual != expected:
+            mismatch = next(i for i, (a, e) in enumerate(zip(actual, expected)) if a != e)
+            raise AssertionError('{} output differs from the reference at row {}: {!r} != {!r}'
+                                 .format(name, mismatch, actual[mismatch], expected[mismatch]))
+
+        reference_time = _best_time(lambda: [reference(full) for full in full_users], args.repeat)
+        exporter_time = _best_time(
+            lambda: [exporter.format(full, context) for full in full_users], args.repeat)
+        result = {
+            'exporter': name,
+            'rows': args.rows,
+            'bio_size': args.bio_size,
+            'reference_rows_per_sec': round(args.rows / reference_time),
+            'rows_per_sec': round(args.rows / exporter_time),
+            'speedup': round(reference_time / exporter_time, 2),
+        }
+        _report(result, args.json)
+
+    write_times = {}
+    for name in ('csv', 'stdcsv'):
+        exporter = exporters.create(name)
+        write_times[name] = _best_time(
+            lambda: _write(exporter, full_users, context), args.repeat)
+        _report({
+            'exporter': name,
+            'path': 'write',
+            'rows': args.rows,
+            'bio_size': args.bio_size,
+            'rows_per_sec': round(args.rows / write_times[name]),
+        }, args.json)
+
+    # Besides the generated bios, fields with every character csv treats specially
+    checked_users = full_users + [
+        UserRecord(index, username='user_{}'.format(index), about=about)
+        for index, about in enumerate(_READ_BACK_BIOS, start=len(full_users) + 1)]
+    for quoting in ('minimal', 'all'):
+        exporter.quoting = quoting
+        stdcsv_output = _write(exporter, checked_users, context)
+        rows = list(csv.reader(io.StringIO(stdcsv_output, newline='')))
+        expected = [[str(field) if field is not None else '' for field in row]
+                    for row in [exporter.HEADER] + [exporter.format(full, context)
+                                                    for full in checked_users]]
+        if rows != expected:
+            raise AssertionError('stdcsv output with {} quoting does not read back '
+                                 'into the original fields'.format(quoting))
+
+
+# Bios the read back check of 'stdcsv' output includes
+_READ_BACK_BIOS = (
+    'C:\\path\\to',
+    'ends with a backslash \\',
+    '\\"quoted\\" and "double quoted"',
+    'comma, semicolon; tab\tend',
+    'line\nbreak and\r\nCRLF',
+)
+
+
+def _write(exporter, full_users, context, batch_size=1000):
+    """ Writes users the same way as OutputWriter does, into memory """
+    out = io.StringIO(newline='')
+    exporter.begin_final_file(out, context)
+    write_batch = getattr(exporter, 'write_batch', None)
+    for start in range(0, len(full_users), batch_size):
+        batch = [exporter.format(full, context) for full in full_users[start:start + batch_size]]
+        if write_batch is not None:
+            write_batch(out, batch, context)
+        else:
+            out.write('\n'.join(batch))
+            out.write('\n')
+    return out.getvalue()
+
+
+def _report(result, json_file):
+    line = json.dumps(result, sort_keys=True)
+    print(line)
+    if json_file:
+        with open(json_file, 'a', encoding='utf-8') as results_file:
+            print(line, file=results_file)
+
+
+def _best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Original escaping of exporters: a regex sub with a Python callback per special character
+
+_CSV_ESCAPE = re.compile(r'[\x00-\x1f\\"\b\f\n\r\t]')
+_CSV_ESCAPE_DICT = {'\\': '\\\\', '"': '""', '\b': '\\b', '\f': '\\f',
+                    '\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_TEXT_ESCAPE = re.compile(r'[\x00-\x1f\b\f\n\r\t]')
+_TEXT_ESCAPE_DICT = {'\\': '\\\\', '\b': '\\b', '\f': '\\f',
+                     '\n': '\\n', '\r': '\\r', '\t': '\\t'}
+for _i in range(0x20):
+    _CSV_ESCAPE_DICT.setdefault(chr(_i), '\\u{0:04x}'.format(_i))
+    _TEXT_ESCAPE_DICT.setdefault(chr(_i), '\\u{0:04x}'.format(_i))
+
+
+def _reference_encode(s, pattern, escape_dict):
+    if not s:
+        return s
+    return pattern.sub(lambda match: escape_dict[match.group(0)], s)
+
+
+def _reference_csv_format(full):
+    id, first_name, last_name, username, phone, about = common.extract_user_data(full)
+    return ",".join([str(id),
+                     quoted_if_has_comma(_reference_encode(username, _CSV_ESCAPE, _CSV_ESCAPE_DICT)),
+                     quoted_if_has_comma(_reference_encode(first_name, _CSV_ESCAPE, _CSV_ESCAPE_DICT)),
+                     quoted_if_has_comma(_reference_encode(last_name, _CSV_ESCAPE, _CSV_ESCAPE_DICT)),
+                     ein(phone),
+                     quoted_if_has_comma(_reference_encode(about, _CSV_ESCAPE, _CSV_ESCAPE_DICT))])
+
+
+def _reference_text_format(full):
+    id, first_name, last_name, username, phone, about = common.extract_user_data(full)
+    return '[id={:10d}, {:10s} ({:18s}), phone={:11s}] {}'.format(
+        id, uin(username, 10), uin(first_name, 7) + " " + uin(last_name, 10), uin(phone, 11),
+        ein(_reference_encode(about, _TEXT_ESCAPE, _TEXT_ESCAPE_DICT)))
+
+
+if __name__ == '__main__':
+    main()
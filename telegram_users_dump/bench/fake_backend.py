@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Local stand-in of Telegram servers used by benchmarks. """
+
+import asyncio
+import random
+import string
+import time
+from telethon import functions, types
+from telethon.errors import FloodWaitError
+from telethon.sessions import MemorySession
+from telegram_users_dump.telegram_dumper import TelegramDumper
+
+
+def _word(seed):
+    """ Returns a random lowercase word of 2-9 letters, the same for the same seed """
+    rnd = random.Random(seed)
+    return ''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(2, 9)))
+
+
+# Vocabulary of synthetic names and bios
+_WORDS = [_word(i) for i in range(1000)]
+
+
+class FakeTelegramBackend:
+    """ Serves synthetic chat participants and full user profiles.
+
+        Answers GetFullChannelRequest, GetParticipantsRequest (with prefix search
+        and a listing cap) and GetFullUserRequest after a configurable latency.
+        A fraction of requests fails with FloodWaitError.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, users_count=1000, latency=0.05, jitter=0.5,
+                 flood_rate=0.0, flood_seconds=1, bio_size=70,
+                 listing_cap=10000, seed=1):
+        """ constructor
+            :param users_count:   Number of chat participants
+            :param latency:       Mean request latency in seconds
+            :param jitter:        Latency varies by +-jitter share of the mean
+            :param flood_rate:    Share of requests failing with a flood wait
+            :param flood_seconds: Flood wait duration
+            :param bio_size:      Mean bio length in characters. Half of the users have no bio.
+            :param listing_cap:   Max number of participants returned for one search query
+            :param seed:          Random seed, so that runs are comparable
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.listing_cap = listing_cap
+        self.requests_count = {}
+        self.flood_waits_count = 0
+        # Per-user latency: from the user being listed till its full profile is served
+        self.user_latencies = []
+        self._random = random.Random(seed)
+        self._listed_at = {}
+        self.users = [self._make_user(i) for i in range(users_count)]
+        self._users_by_id = {user.id: user for user in self.users}
+        self._bios = {user.id: self._make_bio(bio_size) for user in self.users}
+
+    async def __call__(self, request):
+        name = type(request).__name__
+        self.requests_count[name] = self.requests_count.get(name, 0) + 1
+        await asyncio.sleep(self.latency * (1 + self.jitter * (2 * self._random.random() - 1)))
+        if self.flood_rate and self._random.random() < self.flood_rate:
+            self.flood_waits_count += 1
+            raise FloodWaitError(request, capture=self.flood_seconds)
+
+        if isinstance(request, functions.channels.GetFullChannelRequest):
+            return types.messages.ChatFull(
+                full_chat=types.ChannelFull(
+                    id=1, about='', read_inbox_max_id=0, read_outbox_max_id=0,
+                    unread_count=0, chat_photo=None, notify_settings=None,
+                    exported_invite=None, bot_info=[], pts=0,
+                    participants_count=len(self.users)),
+                chats=[], users=[])
+        if isinstance(request, functions.channels.GetParticipantsRequest):
+            return self._participants(request)
+        if isinstance(request, functions.users.GetFullUserRequest):
+            return self._full_user(request)
+        raise NotImplementedError('{} is not supported by the fake backend'.format(name))
+
+    def full_users(self):
+        """ Full profiles of all participants, bypassing the request path """
+        return [types.UserFull(user=user, settings=None, notify_settings=None,
+                               common_chats_count=0, about=self._bios[user.id])
+                for user in self.users]
+
+    def _participants(self, request):
+        query = request.filter.q.lower()
+        matched = [user for user in self.users if not query or any(
+            name and name.lower().startswith(query)
+            for name in (user.first_name, user.last_name, user.username))]
+        matched = matched[:self.listing_cap]
+        page = matched[request.offset:request.offset + request.limit]
+        now = time.monotonic()
+        for user in page:
+            self._listed_at.setdefault(user.id, now)
+        return types.channels.ChannelParticipants(
+            count=len(matched),
+            participants=[types.ChannelParticipant(user_id=user.id, date=None) for user in page],
+            users=page)
+
+    def _full_user(self, request):
+        # Requests are not resolved into InputUser since they skip telethon's sender
+        peer = request.id
+        user = self._users_by_id[getattr(peer, 'user_id', None) or peer.id]
+        listed_at = self._listed_at.get(user.id)
+        if listed_at is not None:
+            self.user_latencies.append(time.monotonic() - listed_at)
+        return types.UserFull(user=user, settings=None, notify_settings=None,
+                              common_chats_count=0, about=self._bios[user.id])
+
+    def _make_user(self, i):
+        rnd = self._random
+        return types.User(
+            id=i + 1, access_hash=rnd.getrandbits(63),
+            first_name=rnd.choice(_WORDS).title(),
+            last_name=rnd.choice(_WORDS).title() if rnd.random() < 0.6 else None,
+            username=rnd.choice(_WORDS) + str(i) if rnd.random() < 0.5 else None,
+            phone=str(380000000000 + i) if rnd.random() < 0.1 else None,
+            bot=rnd.random() < 0.02,
+            status=types.UserStatusRecently() if rnd.random() < 0.5 else None)
+
+    def _make_bio(self, size):
+        if not size or self._random.random() < 0.5:
+            return None
+        words = []
+        length = 0
+        target = self._random.randint(1, 2 * size)
+        while length < target:
+            word = self._random.choice(_WORDS)
+            words.append(word)
+            length += len(word) + 1
+        bio = ' '.join(words)[:target]
+        # Some bios contain characters exporters have to escape
+        if self._random.random() < 0.2:
+            bio = bio.replace(' ', '\n', 1).replace(' ', ', "', 1)
+        return bio
+
+
+class BenchDumper(TelegramDumper):
+    """ The real TelegramDumper whose network calls are served by FakeTelegramBackend """
+
+    def __init__(self, backend, settings, exporter):
+        super().__init__(MemorySession(), settings, exporter)
+        self.backend = backend
+
+    def _init_connect(self):
+        pass
+
+    def _resolve_chats(self, names):
+        return {name: types.InputPeerChannel(i + 1, 0) for i, name in enumerate(names)}
+
+    async def get_input_entity(self, peer):
+        return peer
+
+    async def __call__(self, request, ordered=False):
+        return await self.backend(request)
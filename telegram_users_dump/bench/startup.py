@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Benchmark of CLI startup time.
+
+Usage:
+python -m telegram_users_dump.bench.startup [--repeat N] [--top N] [--json FILE] [--check]
+
+Runs commands that don't connect to Telegram in fresh interpreters under
+`python -X importtime` and reports their wall time, the total import time
+and the heaviest modules they import, as one JSON line. With --json
+the line is also appended to a file, so that runs can be compared.
+With --check it fails if one of them imports a dependency of the
+network dump (see HEAVY_MODULES).
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+# Commands measured: name -> arguments of `python -m telegram_users_dump`
+COMMANDS = {
+    'help': ['--help'],
+    'argument_error': ['-c', '@python', '-p', 'not-a-phone'],
+    'exporters': ['exporters'],
+    'export_help': ['export', '--help'],
+    'query_help': ['query', '--help'],
+    'daemon_client_help': ['jobs', '--help'],
+}
+
+# Modules only a network dump needs. The commands above must not import them.
+HEAVY_MODULES = ('telethon', 'joblib', 'pyarrow', 'multiprocessing', 'sqlite3')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m telegram_users_dump.bench.startup')
+    parser.add_argument('--repeat', default=5, type=int)
+    parser.add_argument('--top', default=5, type=int)
+    parser.add_argument('--json', default='', type=str)
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    line = json.dumps(result, sort_keys=True)
+    print(line)
+    if args.json:
+        with open(args.json, 'a', encoding='utf-8') as results_file:
+            print(line, file=results_file)
+    if args.check:
+        failed = {name: command['heavy_imports'] for name, command in result['commands'].items()
+                  if command['heavy_imports']}
+        if failed:
+            print('Heavy modules imported at startup: {}'.format(failed), file=sys.stderr)
+            sys.exit(1)
+
+
+def run_benchmark(args):
+    """ Measures every command of COMMANDS and the import of the dump pipeline
+        :return: dict of measured metrics
+    """
+    commands = {name: measure(['-m', 'telegram_users_dump'] + argv, args.repeat, args.top)
+                for name, argv in COMMANDS.items()}
+    # What a network dump pays for on top of the startup
+    pipeline = measure(['-c', 'import telegram_users_dump.telegram_dumper'],
+                       args.repeat, args.top)
+    return {
+        'repeat': args.repeat,
+        'commands': commands,
+        'dump_pipeline_import_ms': pipeline['import_ms'],
+        'dump_pipeline_top_imports': pipeline['top_imports'],
+        'python': platform.python_version(),
+    }
+
+
+def measure(python_args, repeat, top):
+    """ Runs python with python_args `repeat` times.
+        :return: dict with median wall time, import time of the last run
+                 and the heaviest top level imports
+    """
+    wall_times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime'] + python_args,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                 universal_newlines=True, check=False)
+        wall_times.append(time.perf_counter() - started)
+    imports = parse_importtime(process.stderr)
+    top_level = sorted(((name, cumulative) for name, depth, cumulative in imports if depth == 0),
+                       key=lambda item: -item[1])
+    imported = {name.split('.')[0] for name, _, _ in imports}
+    return {
+        'wall_ms': round(statistics.median(wall_times) * 1000, 1),
+        'wall_min_ms': round(min(wall_times) * 1000, 1),
+        'import_ms': round(sum(cumulative for _, cumulative in top_level) / 1000, 1),
+        'top_imports': {name: round(cumulative / 1000, 1) for name, cumulative in top_level[:top]},
+        'heavy_imports': sorted(imported.intersection(HEAVY_MODULES)),
+        'exit_code': process.returncode,
+    }
+
+
+def parse_importtime(output):
+    """ Parses `-X importtime` report.
+        :return: list of (module, nesting depth, cumulative microseconds) tuples
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            # The header line
+            continue
+        name = parts[2][1:]
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        imports.append((name.strip(), depth, int(parts[1])))
+    return imports
+
+
+if __name__ == '__main__':
+    main()
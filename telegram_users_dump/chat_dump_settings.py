@@ -1,8 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import re
+import csv
 import argparse
+from telegram_users_dump import exporters
 from telegram_users_dump.utils import JOIN_CHAT_PREFIX_URL
+from telegram_users_dump.participant_filter import ParticipantFilter
+from telegram_users_dump.pattern_filter import PatternFilter
+from telegram_users_dump.ordering import ORDERS
+from telegram_users_dump.sampling import parse_sample_size
 
 
 class ChatDumpSettings:
@@ -10,7 +18,13 @@ class ChatDumpSettings:
 
     # pylint: disable=too-many-instance-attributes
     # pylint: disable=too-few-public-methods
-    def __init__(self, usage):
+    def __init__(self, usage, argv=None, cwd=None):
+        """ constructor
+            :param usage: Usage text
+            :param argv:  Arguments. (Default: sys.argv)
+            :param cwd:   Directory relative paths in the arguments are resolved against.
+                          (Default: the current directory)
+        """
 
         # From telegram-cli
         self.api_id = 8875274
@@ -19,48 +33,394 @@ class ChatDumpSettings:
         # Parse parameters
         parser = CustomArgumentParser(formatter_class=CustomFormatter, usage=usage)
 
-        parser.add_argument('-c', '--chat', required=True, type=str)
-        parser.add_argument('-p', '--phone', required=True, type=str)
-        parser.add_argument('-f', '--filter', default=".*", required=False, type=str)
+        parser.add_argument('-c', '--chat', dest='chats', action='append', default=[], type=str)
+        parser.add_argument('--chats-file', default='', type=str)
+        parser.add_argument('-p', '--phone', dest='phones', action='append', required=True,
+                            type=str)
+        parser.add_argument('-f', '--filter', dest='filters', action='append', default=[],
+                            type=str)
+        parser.add_argument('--exclude', dest='excludes', action='append', default=[],
+                            type=str)
+        parser.add_argument('--patterns-file', default='', type=str)
         parser.add_argument('-i', '--ignore_case', required=False, action='store_true')
+        parser.add_argument('-w', '--where', default='', required=False, type=str)
         parser.add_argument('-o', '--out', default='', required=False, type=str)
         parser.add_argument('-e', '--exp', default='', type=str)
+        parser.add_argument('--limit', default=0, type=int)
+        parser.add_argument('--time-budget', default='', type=str)
+        parser.add_argument('--order', default='listing', type=str)
+        parser.add_argument('--sample', default='', type=str)
+        parser.add_argument('--write-sample', required=False, action='store_true')
+        parser.add_argument('--concurrency', default=4, type=int)
+        parser.add_argument('--max-rate', default=20.0, type=float)
+        parser.add_argument('--continue', dest='is_continue_mode', required=False,
+                            action='store_true')
+        parser.add_argument('--cache', dest='cache_file', default='', type=str)
+        parser.add_argument('--cache-ttl', default=168.0, type=float)
+        parser.add_argument('--cache-size', default=1000000, type=int)
+        parser.add_argument('--since-snapshot', default='', type=str)
+        parser.add_argument('--store', dest='store_file', default='', type=str)
+        parser.add_argument('--stats', dest='stats_file', default='', type=str)
+        parser.add_argument('--stats-format', default='json', type=str)
+        parser.add_argument('--stats-interval', default=10.0, type=float)
+        parser.add_argument('--profile', dest='profile_file', default='', type=str)
+        parser.add_argument('--csv-dialect', default='excel', type=str)
+        parser.add_argument('--csv-quoting', default='minimal', type=str)
 
-        args = parser.parse_args()
+        args = parser.parse_args(argv)
+        for name in ('chats_file', 'patterns_file', 'since_snapshot', 'store_file',
+                     'cache_file', 'stats_file', 'profile_file'):
+            setattr(args, name, _resolve_path(getattr(args, name), cwd))
 
         # Trim extra spaces in string param values
-        if args.chat:
-            args.chat = args.chat.strip()
-        if args.phone:
-            args.phone = args.phone.strip()
-        
-        # Validate phone number
-        try:
-            if int(args.phone) <= 0:
-                raise ValueError
-        except ValueError:
-            parser.error('Phone number is invalid.')
+        chats = [chat.strip() for chat in args.chats]
+        if args.chats_file:
+            try:
+                with open(args.chats_file, encoding='utf-8') as chats_file:
+                    chats.extend(line.strip() for line in chats_file
+                                 if line.strip() and not line.lstrip().startswith('#'))
+            except OSError as ex:
+                parser.error('Failed to read chats file "{}". {}'.format(
+                    args.chats_file, ex.strerror))
+        # Drop duplicates keeping the order
+        chats = [chat for chat in dict.fromkeys(chats) if chat]
+        if not chats:
+            parser.error('At least one chat is required (-c or --chats-file).')
+        phones = list(dict.fromkeys(phone.strip() for phone in args.phones))
+
+        # Validate phone numbers
+        for phone in phones:
+            try:
+                if int(phone) <= 0:
+                    raise ValueError
+            except ValueError:
+                parser.error('Phone number "{}" is invalid.'.format(phone))
+
+        # Validate participant filter expression
+        if args.where:
+            try:
+                ParticipantFilter(args.where, re.IGNORECASE if args.ignore_case else 0)
+            except ValueError as ex:
+                parser.error(str(ex))
+
+        _validate_patterns(parser, args)
+
+        if args.limit < 0:
+            parser.error('Limit must not be negative.')
+        time_budget = 0.0
+        if args.time_budget:
+            time_budget = parse_duration(args.time_budget)
+            if time_budget is None or time_budget <= 0:
+                parser.error('Time budget must be a positive duration. E.g. 90, 30m or 2h.')
+        if args.order not in ORDERS:
+            parser.error('Order must be one of: {}.'.format(', '.join(ORDERS)))
+        sample_size, sample_fraction = None, None
+        if args.sample:
+            parsed = parse_sample_size(args.sample)
+            if parsed is None:
+                parser.error('Sample must be a positive number of users or a percentage. '
+                             'E.g. 1000 or 1%.')
+            sample_size, sample_fraction = parsed
+            if args.is_continue_mode or args.since_snapshot or args.limit:
+                parser.error('--sample can\'t be used with --continue, --since-snapshot '
+                             'or --limit.')
+        elif args.write_sample:
+            parser.error('--write-sample requires --sample.')
+
+        # Validate number of requests in flight
+        if args.concurrency < 1:
+            parser.error('Concurrency must be a positive number.')
+        if args.max_rate <= 0:
+            parser.error('Max rate must be a positive number.')
+
+        if args.cache_ttl < 0 or args.cache_size < 0:
+            parser.error('Cache TTL and size must not be negative.')
+
+        if args.stats_format not in ('json', 'prometheus'):
+            parser.error('Stats format must be one of: json, prometheus.')
+        if args.stats_interval <= 0:
+            parser.error('Stats interval must be a positive number.')
+
+        _validate_csv_options(parser, args)
 
         # Validate exporter name / set default
         exp_file = 'csv' if not args.exp else args.exp
-        if not exp_file:
-            parser.error('Exporter name is invalid.')
+        _validate_exporter(parser, exp_file)
 
         # Default output file if not specified by user
         OUTPUT_FILE_TEMPLATE = 'telegram_{}.log'
-        if args.out != '':
-            out_file = args.out
-        elif args.chat.startswith(JOIN_CHAT_PREFIX_URL):
-            out_file = OUTPUT_FILE_TEMPLATE.format(args.chat.rsplit('/', 1)[-1])
-        else:
-            out_file = OUTPUT_FILE_TEMPLATE.format(args.chat)
+        if args.out != '' and len(chats) > 1 and '{}' not in args.out:
+            parser.error('Output file name must contain "{}" placeholder '
+                         'for the chat name when several chats are dumped.')
+        out_template = _resolve_path(args.out if args.out != '' else OUTPUT_FILE_TEMPLATE, cwd)
 
-        self.chat_name = args.chat
-        self.phone_num = args.phone
-        self.out_file = out_file
-        self.filter = args.filter
+        if args.since_snapshot:
+            if len(chats) > 1 and '{}' not in args.since_snapshot:
+                parser.error('Snapshot file name must contain "{}" placeholder '
+                             'for the chat name when several chats are dumped.')
+            if args.is_continue_mode:
+                parser.error('--since-snapshot and --continue can\'t be used together.')
+
+        # Chats to dump, each into its own resulting file
+        self.chats = []
+        for chat in chats:
+            if chat.startswith(JOIN_CHAT_PREFIX_URL):
+                short_name = chat.rsplit('/', 1)[-1]
+            else:
+                short_name = chat
+            self.chats.append(ChatTarget(
+                chat, out_template.replace('{}', short_name),
+                args.since_snapshot.replace('{}', short_name) if args.since_snapshot else None))
+
+        self.phone_num = phones[0]
+        # Extra accounts that share full-profile requests with the main one
+        self.worker_phones = phones[1:]
+        self.filters = args.filters
+        self.excludes = args.excludes
+        self.patterns_file = args.patterns_file
         self.ignore_case = args.ignore_case
+        self.where = args.where
         self.exporter = exp_file
+        # Max number of matches written per chat, 0 means no limit
+        self.limit = args.limit
+        # Seconds the whole run may take, 0 means no limit
+        self.time_budget = time_budget
+        self.order = args.order
+        # Sample mode: either a number of users or a fraction of the chat to sample
+        self.is_sample_mode = bool(args.sample)
+        self.sample_size = sample_size
+        self.sample_fraction = sample_fraction
+        self.is_write_sample = args.write_sample
+        self.concurrency = args.concurrency
+        self.max_rate = args.max_rate
+        self.is_continue_mode = args.is_continue_mode
+        self.cache_file = args.cache_file
+        self.cache_ttl = args.cache_ttl
+        self.cache_size = args.cache_size
+        self.is_delta_mode = bool(args.since_snapshot)
+        self.store_file = args.store_file
+        self.stats_file = args.stats_file
+        self.stats_format = args.stats_format
+        self.stats_interval = args.stats_interval
+        self.profile_file = args.profile_file
+        self.csv_dialect = args.csv_dialect
+        self.csv_quoting = args.csv_quoting
+
+
+class DaemonSettings:
+    """ Parses CLI arguments of the dump daemon. """
+
+    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-few-public-methods
+    def __init__(self, usage, argv=None):
+
+        # From telegram-cli
+        self.api_id = 8875274
+        self.api_hash = '559798f4a470d3da86862e3c8c290f85'
+
+        parser = CustomArgumentParser(formatter_class=CustomFormatter, usage=usage)
+
+        parser.add_argument('-p', '--phone', dest='phones', action='append', required=True,
+                            type=str)
+        parser.add_argument('--socket', default=DEFAULT_SOCKET, type=str)
+        parser.add_argument('--max-rate', default=20.0, type=float)
+        parser.add_argument('--cache', dest='cache_file', default='', type=str)
+        parser.add_argument('--cache-ttl', default=168.0, type=float)
+        parser.add_argument('--cache-size', default=1000000, type=int)
+        parser.add_argument('--stats', dest='stats_file', default='', type=str)
+        parser.add_argument('--stats-format', default='json', type=str)
+        parser.add_argument('--stats-interval', default=10.0, type=float)
+
+        args = parser.parse_args(argv)
+
+        phones = list(dict.fromkeys(phone.strip() for phone in args.phones))
+        for phone in phones:
+            try:
+                if int(phone) <= 0:
+                    raise ValueError
+            except ValueError:
+                parser.error('Phone number "{}" is invalid.'.format(phone))
+        if args.max_rate <= 0:
+            parser.error('Max rate must be a positive number.')
+        if args.cache_ttl < 0 or args.cache_size < 0:
+            parser.error('Cache TTL and size must not be negative.')
+        if args.stats_format not in ('json', 'prometheus'):
+            parser.error('Stats format must be one of: json, prometheus.')
+        if args.stats_interval <= 0:
+            parser.error('Stats interval must be a positive number.')
+
+        self.socket = os.path.abspath(os.path.expanduser(args.socket))
+        self.phone_num = phones[0]
+        self.worker_phones = phones[1:]
+        self.max_rate = args.max_rate
+        # Jobs run in their own directories, so the daemon's files are kept by absolute paths
+        self.cache_file = os.path.abspath(args.cache_file) if args.cache_file else ''
+        self.cache_ttl = args.cache_ttl
+        self.cache_size = args.cache_size
+        self.stats_file = os.path.abspath(args.stats_file) if args.stats_file else ''
+        self.stats_format = args.stats_format
+        self.stats_interval = args.stats_interval
+        # Settings of a dump the daemon is created with. Jobs bring their own.
+        self.chats = []
+        self.is_delta_mode = False
+
+
+class ExportSettings:
+    """ Parses CLI arguments of offline re-export of an archive. """
+
+    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-few-public-methods
+    def __init__(self, usage, argv=None):
+        parser = CustomArgumentParser(formatter_class=CustomFormatter, usage=usage)
+
+        parser.add_argument('archive', type=str)
+        parser.add_argument('-f', '--filter', dest='filters', action='append', default=[],
+                            type=str)
+        parser.add_argument('--exclude', dest='excludes', action='append', default=[],
+                            type=str)
+        parser.add_argument('--patterns-file', default='', type=str)
+        parser.add_argument('-i', '--ignore_case', required=False, action='store_true')
+        parser.add_argument('-o', '--out', default='', required=False, type=str)
+        parser.add_argument('-e', '--exp', default='csv', type=str)
+        parser.add_argument('-j', '--jobs', default=1, type=int)
+        parser.add_argument('--csv-dialect', default='excel', type=str)
+        parser.add_argument('--csv-quoting', default='minimal', type=str)
+
+        args = parser.parse_args(argv)
+
+        _validate_patterns(parser, args)
+        _validate_csv_options(parser, args)
+        if args.jobs < 1:
+            parser.error('Number of jobs must be a positive number.')
+        if args.exp == 'archive':
+            parser.error('An archive can\'t be re-exported into an archive.')
+        _validate_exporter(parser, args.exp)
+
+        self.archive = args.archive
+        # Default output file: the archive name without extension
+        self.out_file = args.out if args.out else os.path.splitext(args.archive)[0]
+        self.filters = args.filters
+        self.excludes = args.excludes
+        self.patterns_file = args.patterns_file
+        self.ignore_case = args.ignore_case
+        self.exporter = args.exp
+        self.jobs = args.jobs
+        self.csv_dialect = args.csv_dialect
+        self.csv_quoting = args.csv_quoting
+        # Options of a dump exporters check
+        self.is_continue_mode = False
+        self.is_delta_mode = False
+
+
+class QuerySettings:
+    """ Parses CLI arguments of a search of the profile store. """
+
+    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-few-public-methods
+    def __init__(self, usage, argv=None):
+        parser = CustomArgumentParser(formatter_class=CustomFormatter, usage=usage)
+
+        parser.add_argument('store_file', type=str)
+        parser.add_argument('-f', '--filter', dest='filters', action='append', default=[],
+                            type=str)
+        parser.add_argument('--exclude', dest='excludes', action='append', default=[],
+                            type=str)
+        parser.add_argument('--patterns-file', default='', type=str)
+        parser.add_argument('-i', '--ignore_case', required=False, action='store_true')
+        parser.add_argument('-c', '--chat', default='', type=str)
+        parser.add_argument('-m', '--match', default='', type=str)
+        parser.add_argument('-o', '--out', default='', required=False, type=str)
+        parser.add_argument('-e', '--exp', default='csv', type=str)
+        parser.add_argument('--limit', default=0, type=int)
+        parser.add_argument('--csv-dialect', default='excel', type=str)
+        parser.add_argument('--csv-quoting', default='minimal', type=str)
+
+        args = parser.parse_args(argv)
+
+        _validate_patterns(parser, args)
+        _validate_csv_options(parser, args)
+        if not os.path.exists(args.store_file):
+            parser.error('Store "{}" doesn\'t exist.'.format(args.store_file))
+        if args.limit < 0:
+            parser.error('Limit must not be negative.')
+        _validate_exporter(parser, args.exp)
+
+        self.store_file = args.store_file
+        # Without an output file the found users are printed
+        self.out_file = args.out
+        self.filters = args.filters
+        self.excludes = args.excludes
+        self.patterns_file = args.patterns_file
+        self.ignore_case = args.ignore_case
+        self.chat = args.chat.strip()
+        # FTS5 query the users have to match in addition to the filters
+        self.match = args.match
+        self.exporter = args.exp
+        self.limit = args.limit
+        self.csv_dialect = args.csv_dialect
+        self.csv_quoting = args.csv_quoting
+        # Options of a dump exporters check
+        self.is_continue_mode = False
+        self.is_delta_mode = False
+
+
+def parse_duration(value):
+    """ Parses a duration in seconds, optionally with s, m or h suffix.
+        :return: Number of seconds or None if value is invalid
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d*)?)\s*([smh]?)\s*', value)
+    if match is None:
+        return None
+    return float(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600}[match.group(2)]
+
+
+def _validate_patterns(parser, args):
+    """ Compiles bio patterns to report errors in them """
+    filter_flags = re.IGNORECASE if args.ignore_case else 0
+    try:
+        if args.patterns_file:
+            PatternFilter.from_file(args.patterns_file, args.filters, args.excludes,
+                                    filter_flags)
+        else:
+            PatternFilter(args.filters, args.excludes, filter_flags)
+    except ValueError as ex:
+        parser.error(str(ex))
+    except OSError as ex:
+        parser.error('Failed to read patterns file "{}". {}'.format(
+            args.patterns_file, ex.strerror))
+
+
+def _resolve_path(path, cwd):
+    """ Joins a relative path with cwd. Empty paths and cwd are left as is. """
+    return os.path.join(cwd, path) if cwd and path else path
+
+
+def _validate_exporter(parser, name):
+    """ Checks the exporter exists without importing it """
+    if not exporters.exists(name):
+        parser.error('Unknown exporter "{}". Available exporters: {}.'.format(
+            name, ', '.join(exporters.available())))
+
+
+def _validate_csv_options(parser, args):
+    if args.csv_dialect not in csv.list_dialects():
+        parser.error('CSV dialect must be one of: {}.'.format(', '.join(csv.list_dialects())))
+    if args.csv_quoting not in ('minimal', 'all', 'nonnumeric', 'none'):
+        parser.error('CSV quoting must be one of: minimal, all, nonnumeric, none.')
+
+
+# Default path of the daemon's Unix socket
+DEFAULT_SOCKET = '~/.telegram_users_dump.sock'
+
+
+class ChatTarget:
+    """ A chat to dump, its resulting file and optional snapshot file of delta dumps """
+
+    # pylint: disable=too-few-public-methods
+    def __init__(self, chat_name, out_file, snapshot_file=None):
+        self.chat_name = chat_name
+        self.out_file = out_file
+        self.snapshot_file = snapshot_file
 
 
 class CustomFormatter(argparse.HelpFormatter):
@@ -81,7 +441,7 @@ class CustomFormatter(argparse.HelpFormatter):
     def _format_usage(self, usage, actions, groups, prefix):
         # if usage is specified, use that
         if usage is not None:
-            usage = usage % dict(prog=self._prog)
+            usage = usage.replace('%(prog)s', self._prog)
 
         return "\n\r%s\n\r" % usage
 
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" On-disk journal of processed users used to resume interrupted dumps. """
+
+import os
+import logging
+
+
+class Checkpoint:
+    """ Append-only journal of processed user ids.
+
+        Every line holds an id of a processed user (whether it matched the filter or not).
+        A '#<size>' line commits all ids written above it and records the size
+        the output file had at that moment. Ids after the last commit line
+        are considered not processed.
+    """
+
+    def __init__(self, path):
+        """ constructor
+            :param path: Path to the journal file
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.pending = []
+        self._file = None
+
+    def load(self):
+        """ Reads the journal and cuts off everything after the last commit line.
+
+            :return: (set of processed user ids, output file size) tuple.
+                     Size is None if nothing has been committed yet.
+        """
+        processed = set()
+        size = None
+        if not os.path.exists(self.path):
+            return processed, size
+
+        pending = []
+        committed_pos = 0
+        pos = 0
+        with open(self.path, 'rb') as journal:
+            for line in journal:
+                pos += len(line)
+                if not line.endswith(b'\n'):
+                    # Torn write of the last line
+                    break
+                if line.startswith(b'#'):
+                    processed.update(pending)
+                    pending.clear()
+                    size = int(line[1:])
+                    committed_pos = pos
+                else:
+                    pending.append(int(line))
+        if pending or pos != committed_pos:
+            self.logger.debug('Dropping %s uncommitted journal entries.', len(pending))
+            with open(self.path, 'r+b') as journal:
+                journal.truncate(committed_pos)
+        return processed, size
+
+    def open(self, resume=False):
+        """ Opens the journal for writing.
+            :param resume: Append to the existing journal instead of starting a new one
+        """
+        self._file = open(self.path, 'a' if resume else 'w', encoding='ascii')
+
+    def add(self, user_id):
+        """ Marks user as processed. Takes effect at the next commit. """
+        self.pending.append(user_id)
+
+    def commit(self, size):
+        """ Writes pending ids followed by a commit line.
+            :param size: Current size of the output file
+        """
+        if self.pending:
+            self._file.write(''.join('{}\n'.format(user_id) for user_id in self.pending))
+            self.pending.clear()
+        self._file.write('#{}\n'.format(size))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """ Deletes the journal of a finished dump """
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Long-running dumper that takes dump jobs over a Unix socket.
+
+    Protocol: the client sends one JSON object per line and gets JSON lines back.
+        {"cmd": "submit", "args": [<dump options>], "cwd": "/path", "priority": 0,
+         "overwrite": false, "follow": true}
+            Queues a job. Replies with its status, and with "follow" keeps sending
+            it every couple of seconds until the job is over.
+        {"cmd": "status"} or {"cmd": "status", "job": 3}
+            Replies with status of all jobs or one job.
+        {"cmd": "cancel", "job": 3}
+            Cancels a queued job.
+    An error is replied as {"error": "<message>"}.
+"""
+
+import os
+import io
+import json
+import time
+import asyncio
+import logging
+import contextlib
+from telegram_users_dump import exporters
+from telegram_users_dump.telegram_dumper import TelegramDumper
+from telegram_users_dump.chat_dump_settings import ChatDumpSettings
+from telegram_users_dump.exporter_context import ExporterContext
+from telegram_users_dump.user_cache import SessionUserCache
+from telegram_users_dump.exceptions import DumpingError
+from telegram_users_dump.utils import sprint
+
+# Seconds between status updates sent to a client that follows a job
+FOLLOW_INTERVAL = 2.0
+
+# Number of finished jobs whose status is kept
+FINISHED_JOBS_KEPT = 1000
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class DumpJob:
+    """ A dump requested by a client """
+
+    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-few-public-methods
+    def __init__(self, job_id, settings, exporter, cwd, priority=0, overwrite=False):
+        self.id = job_id
+        self.settings = settings
+        self.exporter = exporter
+        self.cwd = cwd
+        self.priority = priority
+        self.overwrite = overwrite
+        self.state = QUEUED
+        self.code = None
+        self.errors = []
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.written = 0
+        # Participants listed and rows written so far, while the job is running
+        self.progress = None
+
+    def status(self):
+        """ Returns JSON serializable status of the job """
+        status = {
+            'job': self.id,
+            'state': self.state,
+            'chats': [target.chat_name for target in self.settings.chats],
+            'files': [target.out_file for target in self.settings.chats],
+            'priority': self.priority,
+            'submitted': round(self.submitted, 3),
+        }
+        if self.started is not None:
+            status['started'] = round(self.started, 3)
+            status['elapsed_sec'] = round((self.finished or time.time()) - self.started, 3)
+        if self.progress is not None:
+            status.update(self.progress())
+        if self.finished is not None:
+            status['code'] = self.code
+            status['written'] = self.written
+        if self.errors:
+            status['errors'] = self.errors
+        return status
+
+    @property
+    def is_over(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+
+class DumpDaemon(TelegramDumper):
+    """ Keeps an authorized connection and runs queued dump jobs one by one.
+
+        Jobs share the connection, worker accounts, their rate limiters
+        (so the request rate learned by one job carries over to the next),
+        the cache of resolved chats and the profiles cache. The socket is served
+        by the same event loop, so the status of a running job is reported live.
+    """
+
+    def __init__(self, session_user_id, settings, job_usage):
+        """ constructor
+            :param session_user_id: Session name of the main account
+            :param settings:        DaemonSettings object
+            :param job_usage:       Usage text of dump options jobs are parsed with
+        """
+        # Jobs change the current directory. The session file and the caches
+        # kept next to it must stay where the daemon was started.
+        if isinstance(session_user_id, str):
+            session_user_id = os.path.abspath(session_user_id)
+        super().__init__(session_user_id, settings, exporter=None)
+        self.daemon_settings = settings
+        self.job_usage = job_usage
+        self.jobs = {}
+        self._queue = asyncio.PriorityQueue()
+        self._last_job_id = 0
+        self._job = None
+
+    def serve(self):
+        """ Serves jobs until interrupted
+            :return: Exit code
+        """
+        ret_code = 0
+        server = None
+        try:
+            self._init_connect()
+            self._init_workers()
+            if os.path.exists(self.daemon_settings.socket):
+                os.remove(self.daemon_settings.socket)
+            # Only the owner may submit jobs. The socket is created with these
+            # permissions, so there is no moment others could connect to it.
+            umask = os.umask(0o177)
+            try:
+                server = self.loop.run_until_complete(asyncio.start_unix_server(
+                    self._handle_client, self.daemon_settings.socket))
+            finally:
+                os.umask(umask)
+            sprint('Listening on "{}"'.format(self.daemon_settings.socket))
+            while True:
+                job = self.loop.run_until_complete(self._queue.get())[2]
+                if job.state == QUEUED:
+                    self._run_job(job)
+        except KeyboardInterrupt:
+            sprint("Received a user's request to interrupt, stopping…")
+        except Exception as ex:  # pylint: disable=broad-except
+            self.logger.error('Uncaught exception ocurred. %s', ex,
+                              exc_info=self.logger.level > logging.INFO)
+            ret_code = 1
+        finally:
+            if server is not None:
+                server.close()
+                with contextlib.suppress(OSError):
+                    os.remove(self.daemon_settings.socket)
+            self._close()
+        return ret_code
+
+    def _run_job(self, job):
+        """ Runs a dump job with its settings and exporter """
+        sprint('Job {} started: {}'.format(job.id, ' '.join(job.status()['chats'])))
+        job.state = RUNNING
+        job.started = time.time()
+        listed = self.metrics.value('participants_listed_total')
+        written = self.metrics.value('written_rows_total')
+        job.progress = lambda: {
+            'listed': self.metrics.value('participants_listed_total') - listed,
+            'written': self.metrics.value('written_rows_total') - written,
+        }
+        # Errors logged while the job runs are reported to the client
+        errors_handler = _JobErrorsHandler(job)
+        package_logger = logging.getLogger('telegram_users_dump')
+        package_logger.addHandler(errors_handler)
+        daemon_cwd = os.getcwd()
+        self._job = job
+        self.settings = job.settings
+        self.exporter = job.exporter
+        self.exporter_context = ExporterContext()
+        self.exporter_context.is_delta_mode = job.settings.is_delta_mode
+        self.output_total_count = 0
+        # Users who are members of several chats of the job are fetched only once
+        persistent_cache = self.user_cache
+        if len(job.settings.chats) > 1:
+            self.user_cache = SessionUserCache(persistent_cache)
+        try:
+            os.chdir(job.cwd)
+            job.code = self._dump_chats()
+        except Exception as ex:  # pylint: disable=broad-except
+            self.logger.error('Job %s failed. %s', job.id, ex,
+                              exc_info=self.logger.level > logging.INFO)
+            job.code = 1
+        finally:
+            self._remove_temp_files()
+            os.chdir(daemon_cwd)
+            package_logger.removeHandler(errors_handler)
+            self.user_cache = persistent_cache
+            self.settings = self.daemon_settings
+            self._job = None
+            job.progress = None
+            job.written = self.output_total_count
+            job.state = DONE if job.code == 0 else FAILED
+            job.finished = time.time()
+            self._forget_finished_jobs()
+        sprint('Job {} {}. {} users written.'.format(job.id, job.state, job.written))
+
+    def _check_preconditions(self, target):
+        """ A job can't ask questions, it overwrites files only if told so """
+        if os.path.exists(target.out_file) and not self.settings.is_continue_mode \
+                and not self._job.overwrite:
+            raise DumpingError('The output file "{}" already exists. Submit the job '
+                               'with --overwrite to replace it.'.format(target.out_file))
+        super()._check_preconditions(target)
+
+    def _is_user_confirmed(self, msg):
+        return self._job is not None and self._job.overwrite
+
+    def _submit(self, request):
+        """ Parses a submitted job and queues it
+            :raises ValueError: if the job is invalid
+        """
+        args = request.get('args')
+        if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+            raise ValueError('"args" must be a list of dump options.')
+        cwd = request.get('cwd') or os.getcwd()
+        # The phone of the daemon goes first, so that any -p of the job shows up
+        # as an extra phone whatever way it's spelled
+        settings = _parse_job_settings(self.job_usage,
+                                       ['-p', self.daemon_settings.phone_num] + args, cwd)
+        if settings.worker_phones or settings.profile_file or settings.stats_file \
+                or settings.cache_file:
+            raise ValueError('-p, --profile, --stats and --cache are options of the daemon, '
+                             'not of a job.')
+        exporter = _create_exporter(settings.exporter, settings)
+        for target in settings.chats:
+            target.out_file += exporter.ext
+        self._last_job_id += 1
+        job = DumpJob(self._last_job_id, settings, exporter, cwd,
+                      int(request.get('priority', 0)), bool(request.get('overwrite', False)))
+        self.jobs[job.id] = job
+        self._queue.put_nowait((-job.priority, job.id, job))
+        return job
+
+    async def _handle_client(self, reader, writer):
+        """ Serves requests of a connected client """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('Request must be a JSON object.')
+                    await self._handle_request(request, writer)
+                except ValueError as ex:
+                    _send(writer, {'error': str(ex)})
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request, writer):
+        cmd = request.get('cmd')
+        if cmd == 'submit':
+            job = self._submit(request)
+            _send(writer, job.status())
+            while request.get('follow') and not job.is_over:
+                await writer.drain()
+                await asyncio.sleep(FOLLOW_INTERVAL)
+                _send(writer, job.status())
+        elif cmd == 'status':
+            if 'job' in request:
+                _send(writer, self._get_job(request['job']).status())
+            else:
+                _send(writer, {'jobs': [job.status() for job in self.jobs.values()]})
+        elif cmd == 'cancel':
+            job = self._get_job(request.get('job'))
+            if job.state != QUEUED:
+                raise ValueError('Job {} is {}. Only queued jobs can be cancelled.'.format(
+                    job.id, job.state))
+            job.state = CANCELLED
+            job.finished = time.time()
+            _send(writer, job.status())
+        else:
+            raise ValueError('Unknown command "{}".'.format(cmd))
+
+    def _get_job(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ValueError('There is no job {}.'.format(job_id))
+        return job
+
+    def _forget_finished_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_over]
+        for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self.jobs[job_id]
+
+
+class _JobErrorsHandler(logging.Handler):
+    """ Collects errors logged while a job runs """
+
+    def __init__(self, job):
+        super().__init__(logging.WARNING)
+        self.job = job
+
+    def emit(self, record):
+        self.job.errors.append(record.getMessage())
+
+
+def _send(writer, message):
+    writer.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+
+
+def _parse_job_settings(usage, argv, cwd):
+    """ Parses dump options of a job. Relative paths are resolved against cwd
+        of the client.
+        :raises ValueError: if they are invalid
+    """
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            return ChatDumpSettings(usage, argv, cwd)
+    except SystemExit:
+        # argparse reports errors by exiting. The message is the last line.
+        lines = stderr.getvalue().strip().splitlines()
+        raise ValueError(lines[-1].split('error: ', 1)[-1] if lines else 'Invalid dump options.')
+
+
+def _create_exporter(exporter_name, settings):
+    """ Loads and configures exporter of a job
+        :raises ValueError: if there is no such exporter or it doesn't accept the settings
+    """
+    exporter = exporters.create(exporter_name)
+    if hasattr(exporter, 'configure'):
+        exporter.configure(settings)
+    return exporter
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Client of the dump daemon. Doesn't import telethon, so it starts fast. """
+
+import os
+import sys
+import json
+import socket
+import argparse
+from telegram_users_dump.chat_dump_settings import DEFAULT_SOCKET
+
+
+def request(socket_path, message):
+    """ Sends a request to the daemon.
+        :param socket_path: Path of the daemon's Unix socket
+        :param message:     Request dict, see the protocol in daemon.py
+
+        :return: Iterator of reply dicts
+        :raises OSError: if the daemon isn't reachable
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(os.path.abspath(os.path.expanduser(socket_path)))
+        connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        connection.shutdown(socket.SHUT_WR)
+        with connection.makefile('rb') as replies:
+            for line in replies:
+                yield json.loads(line)
+
+
+def submit(argv):
+    """ Runs 'submit' command. Options it doesn't know are dump options of the job.
+        Prints status lines of the job and returns its exit code.
+    """
+    parser = argparse.ArgumentParser(prog='telegram_users_dump submit')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, type=str)
+    parser.add_argument('--priority', default=0, type=int)
+    parser.add_argument('--overwrite', action='store_true')
+    parser.add_argument('--detach', action='store_true')
+    args, dump_args = parser.parse_known_args(argv)
+    message = {
+        'cmd': 'submit',
+        'args': dump_args,
+        'cwd': os.getcwd(),
+        'priority': args.priority,
+        'overwrite': args.overwrite,
+        'follow': not args.detach,
+    }
+    return _print_replies(args.socket, message, exit_code=not args.detach)
+
+
+def jobs(argv):
+    """ Runs 'jobs' command: prints status of jobs or cancels a queued one """
+    parser = argparse.ArgumentParser(prog='telegram_users_dump jobs')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, type=str)
+    parser.add_argument('--cancel', default=None, type=int)
+    parser.add_argument('job', nargs='?', default=None, type=int)
+    args = parser.parse_args(argv)
+    if args.cancel is not None:
+        message = {'cmd': 'cancel', 'job': args.cancel}
+    elif args.job is not None:
+        message = {'cmd': 'status', 'job': args.job}
+    else:
+        message = {'cmd': 'status'}
+    return _print_replies(args.socket, message)
+
+
+def _print_replies(socket_path, message, exit_code=False):
+    """ Prints replies as JSON lines
+        :param exit_code: Return exit code of the job the last reply is status of
+    """
+    reply = None
+    try:
+        for reply in request(socket_path, message):
+            print(json.dumps(reply, ensure_ascii=False), flush=True)
+    except OSError as ex:
+        print('ERROR: Failed to reach the daemon at "{}". {}'.format(
+            socket_path, ex.strerror or ex), file=sys.stderr)
+        return 1
+    if reply is None or 'error' in reply:
+        return 1
+    if exit_code:
+        return reply.get('code', 1)
+    return 0
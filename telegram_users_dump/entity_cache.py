@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Persistent cache of resolved chats. Saves a full dialogs scan on repeat runs. """
+
+import os
+import json
+import logging
+from telethon import types, utils
+
+_VERSION = 1
+
+
+class EntityCache:
+    """ Maps chat names to (id, access_hash, type) of resolved entities.
+
+        Entries are indexed in memory by dialog title, by username and by
+        the name a chat was requested with (e.g. an invitation link).
+        The cache is a small JSON file, rewritten atomically on `save()`.
+    """
+
+    def __init__(self, path):
+        """ constructor
+            :param path: Path to the cache file. None keeps the cache in memory only.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self._entries = {}
+        self._by_title = {}
+        self._by_username = {}
+        self._by_alias = {}
+        self._is_dirty = False
+        self._load()
+
+    def get(self, name):
+        """ Looks up a chat name as specified by user.
+
+            :return: telethon InputPeer* object or None
+        """
+        entry = self._entries.get(self._lookup(name))
+        if entry is None:
+            return None
+        return _input_peer(entry)
+
+    def add(self, entity, alias=None):
+        """ Adds a resolved telethon entity.
+            :param entity: Channel, Chat or User object
+            :param alias:  Name the entity was requested with
+        """
+        if isinstance(entity, types.Channel):
+            kind = 'channel'
+        elif isinstance(entity, types.Chat):
+            kind = 'chat'
+        elif isinstance(entity, types.User):
+            kind = 'user'
+        else:
+            return
+        entry = {
+            'id': entity.id,
+            'access_hash': getattr(entity, 'access_hash', None),
+            'type': kind,
+            'title': utils.get_display_name(entity),
+            'username': getattr(entity, 'username', None),
+            'aliases': [],
+        }
+        old = self._entries.get(_key(entry))
+        if old is not None:
+            entry['aliases'] = list(old['aliases'])
+        if alias and alias not in entry['aliases']:
+            entry['aliases'].append(alias)
+        if entry != old:
+            self._index(entry)
+            self._is_dirty = True
+
+    def remove(self, name):
+        """ Drops the entry a name resolves into. Used when the entry turned out to be stale. """
+        entry = self._entries.pop(self._lookup(name), None)
+        if entry is not None:
+            self._unindex(entry)
+            self._is_dirty = True
+
+    def save(self):
+        """ Writes the cache file if anything has changed """
+        if not self._is_dirty or not self.path:
+            return
+        temp_path = self.path + '.part'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as cache_file:
+                json.dump({'version': _VERSION, 'entities': list(self._entries.values())},
+                          cache_file, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+            self._is_dirty = False
+        except OSError as ex:
+            self.logger.warning('Failed to save resolved chats cache "%s". %s',
+                                self.path, ex.strerror)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError) as ex:
+            self.logger.warning('Ignoring broken resolved chats cache "%s". %s', self.path, ex)
+            return
+        if data.get('version') != _VERSION:
+            return
+        for entry in data.get('entities', []):
+            self._index(entry)
+
+    def _lookup(self, name):
+        """ Returns the key of the entry a name resolves into or None """
+        if name.startswith('@'):
+            return self._by_username.get(name[1:].lower())
+        return self._by_alias.get(name) or self._by_title.get(name) \
+            or self._by_username.get(name.lower())
+
+    def _index(self, entry):
+        key = _key(entry)
+        old = self._entries.get(key)
+        if old is not None:
+            self._unindex(old)
+        self._entries[key] = entry
+        if entry['title']:
+            self._by_title[entry['title']] = key
+        if entry['username']:
+            self._by_username[entry['username'].lower()] = key
+        for alias in entry['aliases']:
+            self._by_alias[alias] = key
+
+    def _unindex(self, entry):
+        key = _key(entry)
+        for index, name in ((self._by_title, entry['title']),
+                            (self._by_username, (entry['username'] or '').lower()),
+                            *((self._by_alias, alias) for alias in entry['aliases'])):
+            if index.get(name) == key:
+                del index[name]
+
+
+def is_named(entity, name):
+    """ Tells whether an entity is still called name, by its title or its username.
+        A cached entry fails this when the chat was renamed or the username
+        has moved to another chat.
+    """
+    username = getattr(entity, 'username', None)
+    if username and username.lower() == (name[1:] if name.startswith('@') else name).lower():
+        return True
+    return not name.startswith('@') and utils.get_display_name(entity) == name
+
+
+def _key(entry):
+    """ Ids of users and chats may clash, so the type is a part of the key """
+    return entry['type'], entry['id']
+
+
+def _input_peer(entry):
+    """ Restores InputPeer* object from a cache entry """
+    if entry['type'] == 'channel':
+        return types.InputPeerChannel(entry['id'], entry['access_hash'])
+    if entry['type'] == 'chat':
+        return types.InputPeerChat(entry['id'])
+    return types.InputPeerUser(entry['id'], entry['access_hash'])
@@ -12,3 +12,13 @@ class ExporterContext:
         self.is_first_record = False
         # Is processing the last record
         self.is_last_record = True
+        # Is appending to an existing resulting file
+        self.is_continue_mode = False
+        # Is writing a delta dump: each record has an operation column
+        self.is_delta_mode = False
+        # Operation of the current record in a delta dump: added, changed or removed
+        self.delta_op = None
+        # Is writing a column of patterns each user matched (several -f patterns)
+        self.has_matches_column = False
+        # Patterns the current record matched
+        self.matched_patterns = None
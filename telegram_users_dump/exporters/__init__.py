@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Registry of exporter plugins.
+
+    Exporters are listed and validated without importing them: an exporter
+    module (and whatever it depends on, e.g. pyarrow) is imported only
+    when the exporter is created.
+
+    Built-in exporters live in <name>.py of this package, their class is
+    called <name> too. Other packages can add exporters with an entry point
+    in 'telegram_users_dump.exporters' group, e.g. in setup.cfg:
+        [options.entry_points]
+        telegram_users_dump.exporters =
+            xlsx = my_package.xlsx:XlsxExporter
+"""
+
+import importlib
+
+# Entry point group of third party exporters
+ENTRY_POINT_GROUP = 'telegram_users_dump.exporters'
+
+# Built-in exporters: name -> description
+BUILTIN = {
+    'csv': 'Original comma separated format, one line per user (default)',
+    'stdcsv': 'RFC 4180 csv written with the standard csv module',
+    'text': 'Human readable log',
+    'json': 'JSON Lines, one object per user',
+    'parquet': 'Columnar Parquet file (requires pyarrow)',
+    'arrow': 'Arrow IPC file (requires pyarrow)',
+    'archive': 'Raw profiles to be re-exported offline with export command',
+}
+
+
+def available():
+    """ Lists exporters without importing them
+        :return: dict of name -> description, built-in exporters first
+    """
+    exporters = dict(BUILTIN)
+    for entry_point in _entry_points():
+        exporters.setdefault(entry_point.name, entry_point.value)
+    return exporters
+
+
+def exists(name):
+    """ Tells whether there is an exporter with this name """
+    return name in BUILTIN or any(entry_point.name == name for entry_point in _entry_points())
+
+
+def create(name):
+    """ Imports an exporter and creates an instance of it
+        :param name: Name of exporter. E.g. 'text' or 'json'
+
+        :return: Exporter instance
+        :raises ValueError: if there is no such exporter or it fails to load
+    """
+    try:
+        if name in BUILTIN:
+            exporter_class = getattr(importlib.import_module(__name__ + '.' + name), name)
+        else:
+            entry_point = next((entry_point for entry_point in _entry_points()
+                                if entry_point.name == name), None)
+            if entry_point is None:
+                raise ValueError("There is no exporter '{}'.".format(name))
+            exporter_class = entry_point.load()
+    except (ImportError, AttributeError) as ex:
+        raise ValueError("Failed to load exporter '{}'. {}".format(name, ex))
+    return exporter_class()
+
+
+def _entry_points():
+    """ Entry points of third party exporters. Reading them costs a scan
+        of installed packages' metadata, so it's done only when needed.
+    """
+    from importlib import metadata
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return entry_points.select(group=ENTRY_POINT_GROUP)
+    # Python < 3.10
+    return entry_points.get(ENTRY_POINT_GROUP, [])
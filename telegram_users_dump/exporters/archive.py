@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from telegram_users_dump import archive as archive_format
+from telegram_users_dump.exceptions import DumpingError
+
+
+class archive(object):
+    """ Raw archive exporter plugin. Appends fetched profiles to a compact
+        length-prefixed archive (msgpack if it is installed, json otherwise)
+        that `telegram_users_dump export` re-exports offline with other
+        filters and exporters. Leave -f empty to archive every profile.
+        By convention it has to be called exactly the same as its file name.
+        (Apart from .py extention)
+    """
+    ext = ".archive"
+
+    def __init__(self):
+        """ constructor """
+        self._index = []
+        self._offset = 0
+
+    def configure(self, settings):
+        """ Hook executes once the exporter is loaded.
+            :param settings: ChatDumpSettings object
+        """
+        if settings.is_delta_mode:
+            raise ValueError("'archive' exporter can't write delta dumps.")
+
+    def format(self, fullUser, exporter_context):
+        """ Formatter method. Takes fullUser and converts it to an archive record.
+            Records are written by `write_batch`.
+        """
+        # pylint: disable=unused-argument
+        return archive_format.encode(fullUser)
+
+    def begin_final_file(self, resulting_file, exporter_context):
+        """ Hook executes at the beginning of writing a resulting file.
+            The file is written in binary mode through its underlying buffer.
+        """
+        resulting_file.flush()
+        if exporter_context.is_continue_mode:
+            # The footer has been cut off with the rows written after the last commit.
+            # Index the records being appended to.
+            with open(resulting_file.name, 'rb') as archive_file:
+                if archive_file.read(archive_format.HEADER_SIZE) != archive_format.header():
+                    raise DumpingError('The archive being continued was written '
+                                       'with another encoding.')
+                self._index, self._offset = archive_format.scan(
+                    archive_file, archive_format.HEADER_SIZE)
+        else:
+            resulting_file.buffer.write(archive_format.header())
+            self._index = []
+            self._offset = archive_format.HEADER_SIZE
+
+    def write_batch(self, resulting_file, rows, exporter_context):
+        """ Hook writes a batch of records returned by `format` into the resulting file """
+        # pylint: disable=unused-argument
+        index = self._index
+        offset = self._offset
+        for row in rows:
+            if not index or index[-1][1] == archive_format.CHUNK_SIZE:
+                index.append((offset, 0))
+            index[-1] = (index[-1][0], index[-1][1] + 1)
+            offset += len(row)
+        self._offset = offset
+        resulting_file.buffer.write(b''.join(rows))
+
+    def end_final_file(self, resulting_file, exporter_context):
+        """ Hook executes before the resulting file is closed. Writes the index. """
+        # pylint: disable=unused-argument
+        resulting_file.buffer.write(archive_format.footer(self._index))
+        resulting_file.flush()
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from .parquet import parquet, pyarrow
+
+
+class arrow(parquet):
+    """ Arrow IPC file exporter plugin. Requires pyarrow.
+        The resulting file is uncompressed, so that it can be memory-mapped.
+        By convention it has to be called exactly the same as its file name.
+        (Apart from .py extention)
+    """
+    ext = ".arrow"
+
+    def _open_writer(self, sink, schema):
+        return pyarrow.ipc.new_file(sink, schema)
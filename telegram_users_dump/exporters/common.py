@@ -14,20 +14,20 @@ class common(object):
         pass
 
     @staticmethod
-    def extract_user_data(fullUser):
-        """ Extracts user name from 'sender', message caption and message content from msg.
-            :param msg: Raw message object.
+    def extract_user_data(record):
+        """ Extracts exported fields of a user.
+            :param record: UserRecord object.
 
             :return
-                (...) tuple of message attributes
+                (id, first_name, last_name, username, phone, about) tuple
         """
         # sender = msg.sender
-        id = fullUser.user.id
-        username = fullUser.user.username
-        first_name = fullUser.user.first_name
-        last_name = fullUser.user.last_name
-        phone = fullUser.user.phone
-        about = fullUser.about
+        id = record.id
+        username = record.username
+        first_name = record.first_name
+        last_name = record.last_name
+        phone = record.phone
+        about = record.about
 
         # Get the name of the sender if any
         # is_sent_by_bot = None
@@ -4,7 +4,7 @@
 
 import re
 from .common import common
-from telegram_users_dump.utils import ein, quoted_if_has_comma
+from telegram_users_dump.utils import ein
 
 class csv(object):
     """ csv (comma separated values) exporter plugin.
@@ -27,6 +27,11 @@ class csv(object):
         }
         for i in range(0x20):
             self.ESCAPE_DICT.setdefault(chr(i), '\\u{0:04x}'.format(i))
+        # Control characters apart from \n, \r and \t are rare in user data.
+        # They are escaped with a translate table after the common ones.
+        self.CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+        self.CONTROL_TABLE = {i: self.ESCAPE_DICT[chr(i)]
+                              for i in range(0x20) if chr(i) not in '\n\r\t'}
 
     def format(self, msg, exporter_context):
         """ Formatter method. Takes raw msg and converts it to a *one-line* string.
@@ -35,7 +40,6 @@ class csv(object):
 
             :returns: *one-line* string containing one message data.
         """
-        # pylint: disable=unused-argument
         id, first_name, last_name, username, phone, about = common.extract_user_data(msg)
         # Format a message log record
         # msg_dump_str = '[{}-{:02d}-{:02d} {:02d}:{:02d}] ID={} {}{}: {}'.format(
@@ -43,12 +47,17 @@ class csv(object):
         #     msg.date.hour, msg.date.minute, msg.id, "RE_ID=%s " % re_id if re_id else "",
         #     name, self._py_encode_basestring(content))
 
+        escape = self._escape
         msg_dump_str = ",".join([str(id),
-                                 quoted_if_has_comma(self._py_encode_basestring(username)[0]),
-                                 quoted_if_has_comma(self._py_encode_basestring(first_name)[0]),
-                                 quoted_if_has_comma(self._py_encode_basestring(last_name)[0]),
+                                 escape(username),
+                                 escape(first_name),
+                                 escape(last_name),
                                  ein(phone),
-                                 quoted_if_has_comma(self._py_encode_basestring(about)[0])])
+                                 escape(about)])
+        if exporter_context.is_delta_mode:
+            msg_dump_str = exporter_context.delta_op + "," + msg_dump_str
+        if exporter_context.has_matches_column:
+            msg_dump_str += "," + escape("|".join(exporter_context.matched_patterns or ()))
         return msg_dump_str
 
     def begin_final_file(self, resulting_file, exporter_context):
@@ -57,16 +66,24 @@ class csv(object):
         """
         if not exporter_context.is_continue_mode:
             header_str = ",".join(["User Id", "Username", "First Name", "Last Name", "Phone", "Bio"])
+            if exporter_context.is_delta_mode:
+                header_str = "Op," + header_str
+            if exporter_context.has_matches_column:
+                header_str += ",Matched"
             print(header_str, file=resulting_file)
 
-    # This code is inspired by Python's json encoder's code
-    def _py_encode_basestring(self, s):
-        """Return a JSON representation of a Python string"""
+    def _escape(self, s):
+        """ Escapes a field (see ESCAPE_DICT) and quotes it if it has a comma.
+            Fields without special characters are returned as is
+            after a single regex scan.
+        """
         if not s:
-            return s, False
-        isAnyCharReplaced = False
-        def replace(match):
-            nonlocal isAnyCharReplaced
-            isAnyCharReplaced = True
-            return self.ESCAPE_DICT[match.group(0)]
-        return str(self.ESCAPE.sub(replace, s)), isAnyCharReplaced
+            return ""
+        if self.ESCAPE.search(s) is not None:
+            s = s.replace('\\', '\\\\').replace('"', '""') \
+                .replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+            if self.CONTROL_CHARS.search(s) is not None:
+                s = s.translate(self.CONTROL_TABLE)
+        if ',' in s:
+            return '"' + s + '"'
+        return s
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from .common import common
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json as stdjson
+
+
+class json(object):
+    """ JSON Lines exporter plugin. Writes one JSON object per user.
+        Uses orjson if it is installed, standard json module otherwise.
+        By convention it has to be called exactly the same as its file name.
+        (Apart from .py extention)
+    """
+    ext = ".jsonl"
+
+    FIELDS = ("id", "first_name", "last_name", "username", "phone", "about")
+
+    def format(self, fullUser, exporter_context):
+        """ Formatter method. Takes fullUser and converts it to a *one-line* JSON object. """
+        record = dict(zip(self.FIELDS, common.extract_user_data(fullUser)))
+        if exporter_context.is_delta_mode:
+            record["op"] = exporter_context.delta_op
+        if exporter_context.has_matches_column:
+            record["matched"] = exporter_context.matched_patterns or []
+        if orjson is not None:
+            return orjson.dumps(record).decode('utf-8')
+        return stdjson.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+    def begin_final_file(self, resulting_file, exporter_context):
+        """ Hook executes at the beginning of writing a resulting file.
+            (After BOM is written in case of --addbom)
+        """
+        pass
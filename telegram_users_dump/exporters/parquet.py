@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from .common import common
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class parquet(object):
+    """ Parquet exporter plugin. Requires pyarrow.
+        Users are collected into column buffers which are written
+        as a row group each time they fill up.
+        By convention it has to be called exactly the same as its file name.
+        (Apart from .py extention)
+    """
+    ext = ".parquet"
+
+    # Number of users in one row group
+    ROW_GROUP_SIZE = 65536
+
+    FIELDS = ("id", "first_name", "last_name", "username", "phone", "about")
+
+    def __init__(self):
+        """ constructor """
+        self._writer = None
+        self._schema = None
+        self._columns = None
+
+    def configure(self, settings):
+        """ Hook executes once the exporter is loaded.
+            :param settings: ChatDumpSettings object
+        """
+        if pyarrow is None:
+            raise ValueError("'{}' exporter requires pyarrow package.".format(type(self).__name__))
+        if settings.is_continue_mode:
+            raise ValueError("'{}' exporter can't continue an interrupted dump."
+                             .format(type(self).__name__))
+
+    def format(self, fullUser, exporter_context):
+        """ Formatter method. Takes fullUser and converts it to a row tuple.
+            Rows are serialized by `write_batch`.
+        """
+        row = common.extract_user_data(fullUser)
+        if exporter_context.is_delta_mode:
+            row = (exporter_context.delta_op,) + row
+        if exporter_context.has_matches_column:
+            row += (exporter_context.matched_patterns or [],)
+        return row
+
+    def begin_final_file(self, resulting_file, exporter_context):
+        """ Hook executes at the beginning of writing a resulting file.
+            The file is written in binary mode through its underlying buffer.
+        """
+        resulting_file.flush()
+        fields = [(self.FIELDS[0], pyarrow.int64())] + \
+            [(name, pyarrow.string()) for name in self.FIELDS[1:]]
+        if exporter_context.is_delta_mode:
+            fields.insert(0, ("op", pyarrow.string()))
+        if exporter_context.has_matches_column:
+            fields.append(("matched", pyarrow.list_(pyarrow.string())))
+        self._schema = pyarrow.schema(fields)
+        self._writer = self._open_writer(resulting_file.buffer, self._schema)
+        self._columns = [[] for _ in self._schema]
+
+    def write_batch(self, resulting_file, rows, exporter_context):
+        """ Hook appends a batch of rows returned by `format` to column buffers """
+        # pylint: disable=unused-argument
+        for column, values in zip(self._columns, zip(*rows)):
+            column.extend(values)
+        if len(self._columns[0]) >= self.ROW_GROUP_SIZE:
+            self._write_row_group()
+
+    def end_final_file(self, resulting_file, exporter_context):
+        """ Hook executes at the end of writing a resulting file. Writes the file footer. """
+        # pylint: disable=unused-argument
+        if self._writer is None:
+            return
+        self._write_row_group()
+        self._writer.close()
+        self._writer = None
+
+    def _open_writer(self, sink, schema):
+        return pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+
+    def _write_row_group(self):
+        if not self._columns[0]:
+            return
+        self._writer.write_table(pyarrow.table(self._columns, schema=self._schema))
+        self._columns = [[] for _ in self._schema]
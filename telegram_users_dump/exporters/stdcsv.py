@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+import csv
+from .common import common
+
+# --csv-quoting values
+QUOTING = {
+    'minimal': csv.QUOTE_MINIMAL,
+    'all': csv.QUOTE_ALL,
+    'nonnumeric': csv.QUOTE_NONNUMERIC,
+    'none': csv.QUOTE_NONE,
+}
+
+
+class stdcsv(object):
+    """ RFC 4180 csv exporter plugin built on the standard csv module.
+        Unlike 'csv' exporter, fields are quoted as spreadsheets and pandas
+        expect and line breaks in bios are kept as is inside quoted fields.
+        By convention it has to be called exactly the same as its file name.
+        (Apart from .py extention)
+    """
+    ext = ".csv"
+
+    HEADER = ("User Id", "First Name", "Last Name", "Username", "Phone", "Bio")
+
+    def __init__(self):
+        """ constructor """
+        self.dialect = 'excel'
+        self.quoting = 'minimal'
+        self._writer = None
+
+    def configure(self, settings):
+        """ Hook executes once the exporter is loaded.
+            :param settings: ChatDumpSettings object
+        """
+        self.dialect = settings.csv_dialect
+        self.quoting = settings.csv_quoting
+
+    def format(self, fullUser, exporter_context):
+        """ Formatter method. Takes fullUser and converts it to a row tuple.
+            Rows are serialized by `write_batch`.
+        """
+        row = common.extract_user_data(fullUser)
+        if exporter_context.is_delta_mode:
+            row = (exporter_context.delta_op,) + row
+        if exporter_context.has_matches_column:
+            row += ("|".join(exporter_context.matched_patterns or ()),)
+        return row
+
+    def begin_final_file(self, resulting_file, exporter_context):
+        """ Hook executes at the beginning of writing a resulting file.
+            (After BOM is written in case of --addbom)
+        """
+        # Without quoting delimiters and quotes have to be escaped. In quoted
+        # fields an escape character would double backslashes, which readers
+        # don't undo.
+        escapechar = '\\' if self.quoting == 'none' else None
+        self._writer = csv.writer(resulting_file, dialect=self.dialect,
+                                  quoting=QUOTING[self.quoting], escapechar=escapechar)
+        if not exporter_context.is_continue_mode:
+            header = self.HEADER
+            if exporter_context.is_delta_mode:
+                header = ("Op",) + header
+            if exporter_context.has_matches_column:
+                header += ("Matched",)
+            self._writer.writerow(header)
+
+    def write_batch(self, resulting_file, rows, exporter_context):
+        """ Hook writes a batch of rows returned by `format` into the resulting file """
+        # pylint: disable=unused-argument
+        self._writer.writerows(rows)
@@ -28,6 +28,11 @@ class text(object):
         }
         for i in range(0x20):
             self.ESCAPE_DICT.setdefault(chr(i), '\\u{0:04x}'.format(i))
+        # Control characters apart from \n, \r and \t are rare in user data.
+        # They are escaped with a translate table after the common ones.
+        self.CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+        self.CONTROL_TABLE = {i: self.ESCAPE_DICT[chr(i)]
+                              for i in range(0x20) if chr(i) not in '\n\r\t'}
 
     def format(self, fullUser, exporter_context):
         """ Formatter method. Takes fullUser and converts it to a *one-line* string.
@@ -41,6 +46,11 @@ class text(object):
         # Format a message log record
         user_dump_str = '[id={:10d}, {:10s} ({:18s}), phone={:11s}] {}'.format(
             id, uin(username, 10), uin(first_name, 7) + " " + uin(last_name, 10), uin(phone, 11), ein(self._py_encode_basestring(about)))
+        if exporter_context.is_delta_mode:
+            user_dump_str = '{:7s} {}'.format(exporter_context.delta_op, user_dump_str)
+        if exporter_context.has_matches_column and exporter_context.matched_patterns:
+            user_dump_str += ' [matched: {}]'.format(
+                self._py_encode_basestring(' | '.join(exporter_context.matched_patterns)))
 
         return user_dump_str
 
@@ -55,8 +65,9 @@ class text(object):
     # This code is inspired by Python's json encoder's code
     def _py_encode_basestring(self, s):
         """Return a JSON representation of a Python string"""
-        if not s:
+        if not s or self.ESCAPE.search(s) is None:
             return s
-        def replace(match):
-            return self.ESCAPE_DICT[match.group(0)]
-        return self.ESCAPE.sub(replace, s)
+        s = s.replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+        if self.CONTROL_CHARS.search(s) is not None:
+            s = s.translate(self.CONTROL_TABLE)
+        return s
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Fetch stage of the dump pipeline.
+    Keeps a bounded number of GetFullUserRequest calls in flight.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from telethon import functions
+from telethon.errors import FloodWaitError
+from telegram_users_dump.user_record import UserRecord
+
+
+class FullUserFetcher:
+    """ Fetches full user profiles concurrently.
+
+        Up to `concurrency` requests per account are in flight at any moment.
+        Results are yielded in the same order as the incoming users, so the consumer
+        (filter and exporter) sees a deterministic stream.
+
+        Every request goes through the rate limiter of its account. Flood waits
+        are absorbed: the limiter is notified and the request is retried once
+        the wait is over. With several accounts each request goes to the one that
+        is not blocked by a flood wait and has the least requests in flight,
+        so a flooded account's work moves to the others.
+
+        If a cache is given, only users missing in it (or with stale entries)
+        are requested from the server.
+
+        Fetched profiles are converted into UserRecord objects right away,
+        so that telethon objects don't outlive their request.
+    """
+
+    def __init__(self, accounts, concurrency=1, cache=None):
+        """ constructor
+            :param accounts:     List of Account objects used to send requests.
+                                 The primary one can request any listed user.
+            :param concurrency:  Max number of requests in flight per account
+            :param cache:        Optional UserCache of full profiles
+        """
+        self.logger = logging.getLogger(__name__)
+        self.accounts = accounts
+        self.concurrency = max(1, concurrency) * len(accounts)
+        self.cache = cache
+
+    async def fetch(self, users):
+        """ Async generator that fetches full profiles of `users`.
+            :param users: Async iterable of telethon.tl.types.User objects
+
+            :return: UserRecord objects in the order of `users`
+        """
+        window = deque()
+        try:
+            async for user in users:
+                cached = self.cache.get(user) if self.cache is not None else None
+                if cached is not None:
+                    done = asyncio.get_event_loop().create_future()
+                    done.set_result(cached)
+                    window.append(done)
+                else:
+                    window.append(asyncio.ensure_future(self._fetch_one(user)))
+                if len(window) >= self.concurrency:
+                    yield await window.popleft()
+            while window:
+                yield await window.popleft()
+        finally:
+            # Consumer stopped early or an error occurred: drop what's in flight
+            for task in window:
+                task.cancel()
+            if hasattr(users, 'aclose'):
+                await users.aclose()
+
+    async def _fetch_one(self, user):
+        """ Sends one GetFullUserRequest, retrying it after flood waits """
+        while True:
+            candidates = [(account, account.input_user(user)) for account in self.accounts]
+            candidates = [(account, input_user) for account, input_user in candidates
+                          if input_user is not None]
+            account, input_user = min(candidates, key=lambda candidate: (
+                candidate[0].rate_limiter.blocked_for(),
+                candidate[0].in_flight / candidate[0].rate_limiter.rate))
+            account.in_flight += 1
+            account.requests_count += 1
+            try:
+                full = await account.rate_limiter.call(
+                    account.client, functions.users.GetFullUserRequest(input_user),
+                    retry_flood_waits=len(candidates) == 1)
+                break
+            except FloodWaitError:
+                # The account is blocked now, pick another one
+                continue
+            finally:
+                account.in_flight -= 1
+        record = UserRecord.from_full(full)
+        # Access hashes differ between accounts. Keep the one of the listing account.
+        record.access_hash = getattr(user, 'access_hash', None)
+        if self.cache is not None:
+            self.cache.put(record)
+        return record
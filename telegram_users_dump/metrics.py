@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Counters and latency histograms of the dump pipeline. """
+
+import os
+import json
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+
+# Prefix of exported metric names
+PREFIX = 'telegram_users_dump_'
+
+# Upper bounds of histogram buckets in seconds: 100us .. ~105s, doubling
+BUCKETS = tuple(0.0001 * 2 ** i for i in range(21))
+
+
+class Histogram:
+    """ Latency histogram with fixed exponential buckets """
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """ Upper bound of the bucket the q-quantile falls into """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """ Registry of counters, gauges and histograms.
+
+        A metric is identified by its name and keyword labels, e.g.
+        `metrics.observe('rpc_seconds', 0.12, method='GetFullUserRequest')`.
+        Recording is a dict lookup and an addition, cheap enough for per-user calls.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        """ Increments a counter """
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """ Sets a gauge """
+        self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """ Adds a value (seconds) to a histogram """
+        key = _key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def value(self, name, **labels):
+        """ Returns current value of a counter """
+        return self.counters.get(_key(name, labels), 0)
+
+    def summary(self):
+        """ Returns metrics as a JSON serializable dict """
+        return {
+            'time': round(time.time(), 3),
+            'elapsed_sec': round(time.time() - self.started, 3),
+            'counters': {_format_key(key): value for key, value in self.counters.items()},
+            'gauges': {_format_key(key): value for key, value in self.gauges.items()},
+            'histograms': {_format_key(key): {
+                'count': histogram.count,
+                'sum': round(histogram.sum, 6),
+                'p50': histogram.quantile(0.5),
+                'p99': histogram.quantile(0.99),
+            } for key, histogram in self.histograms.items()},
+        }
+
+    def to_prometheus(self):
+        """ Returns metrics in Prometheus text exposition format """
+        lines = []
+        for kind, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+            for name in sorted({key[0] for key in metrics}):
+                lines.append('# TYPE {}{} {}'.format(PREFIX, name, kind))
+                for key in sorted(k for k in metrics if k[0] == name):
+                    lines.append('{} {}'.format(_format_key(key, PREFIX), metrics[key]))
+        for name in sorted({key[0] for key in self.histograms}):
+            lines.append('# TYPE {}{} histogram'.format(PREFIX, name))
+            for key in sorted(k for k in self.histograms if k[0] == name):
+                histogram = self.histograms[key]
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    bucket_key = (name + '_bucket',
+                                  key[1] + (('le', bound if bound == '+Inf' else '{:g}'.format(bound)),))
+                    lines.append('{} {}'.format(_format_key(bucket_key, PREFIX), cumulative))
+                lines.append('{} {}'.format(_format_key((name + '_sum', key[1]), PREFIX),
+                                            histogram.sum))
+                lines.append('{} {}'.format(_format_key((name + '_count', key[1]), PREFIX),
+                                            histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsReporter:
+    """ Periodically writes metrics into a file.
+
+        'json' format appends one stats line per interval.
+        'prometheus' format atomically rewrites a text file,
+        e.g. for node_exporter's textfile collector.
+    """
+
+    def __init__(self, metrics, path, fmt='json', interval=10.0):
+        """ constructor
+            :param metrics:  Metrics to report
+            :param path:     Path of the stats file
+            :param fmt:      'json' or 'prometheus'
+            :param interval: Seconds between reports
+        """
+        self.logger = logging.getLogger(__name__)
+        self.metrics = metrics
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        # Called before each report to update gauges
+        self.collectors = []
+
+    async def run(self):
+        """ Reports metrics every interval until cancelled """
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
+
+    def report(self):
+        """ Writes current metrics into the stats file """
+        for collector in self.collectors:
+            collector(self.metrics)
+        try:
+            if self.fmt == 'prometheus':
+                temp_path = self.path + '.part'
+                with open(temp_path, 'w', encoding='utf-8') as stats_file:
+                    stats_file.write(self.metrics.to_prometheus())
+                os.replace(temp_path, self.path)
+            else:
+                with open(self.path, 'a', encoding='utf-8') as stats_file:
+                    print(json.dumps(self.metrics.summary(), sort_keys=True), file=stats_file)
+        except OSError as ex:
+            self.logger.warning('Failed to write stats file "%s". %s', self.path, ex.strerror)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_key(key, prefix=''):
+    name, labels = key
+    if not labels:
+        return prefix + name
+    return '{}{}{{{}}}'.format(prefix, name, ','.join(
+        '{}="{}"'.format(label, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for label, value in labels))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Order in which full profiles of participants are requested. """
+
+import heapq
+from datetime import datetime, timedelta, timezone
+from telegram_users_dump.participant_filter import status_name
+
+# --order values
+ORDERS = ('listing', 'likely')
+
+# Number of listed participants ranked at once by 'likely' order
+ORDER_WINDOW = 10000
+
+# Users seen online recently are the ones most likely to have filled in a bio
+_STATUS_SCORES = {
+    'online': 5,
+    'recently': 4,
+    'last_week': 3,
+    'offline': 2,
+    'last_month': 1,
+    'long_ago': 0,
+}
+
+# Users offline for less than this are ranked as seen recently
+_RECENTLY_OFFLINE = timedelta(days=3)
+
+
+def likelihood(user):
+    """ Scores how likely a participant is to have a profile worth dumping.
+        :param user: telethon.tl.types.User object
+    """
+    if user.deleted:
+        return -10
+    status = status_name(user.status)
+    if status == 'offline':
+        was_online = getattr(user.status, 'was_online', None)
+        if was_online is not None \
+                and datetime.now(timezone.utc) - was_online < _RECENTLY_OFFLINE:
+            status = 'recently'
+    score = _STATUS_SCORES[status]
+    if user.bot:
+        score -= 6
+    if user.username:
+        score += 1
+    if user.photo is not None:
+        score += 1
+    return score
+
+
+async def likely_first(users, window=ORDER_WINDOW):
+    """ Async generator that reorders users, most likely matches first.
+        Users are ranked within a sliding window of `window` listed users,
+        so fetching starts before the whole chat is listed.
+        :param users: Async iterable of telethon.tl.types.User objects
+    """
+    heap = []
+    # Ties keep the listing order
+    sequence = 0
+    try:
+        async for user in users:
+            heapq.heappush(heap, (-likelihood(user), sequence, user))
+            sequence += 1
+            if len(heap) >= window:
+                yield heapq.heappop(heap)[2]
+        while heap:
+            yield heapq.heappop(heap)[2]
+    finally:
+        if hasattr(users, 'aclose'):
+            await users.aclose()
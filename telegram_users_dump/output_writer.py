@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Streaming writer of the resulting file. """
+
+import os
+import time
+import logging
+
+# Size of the write buffer of the underlying file
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+class OutputWriter:
+    """ Streams formatted users into a temp file next to the resulting file.
+
+        Rows are collected in batches and flushed through a buffered writer,
+        in the order they were passed to `write()`. When the dump is over the
+        temp file is atomically renamed into the resulting file.
+
+        Rows are lines of text joined by newlines, unless the exporter has
+        `write_batch` hook. Then rows are whatever its `format` returns
+        and the hook serializes each batch itself. Optional `end_final_file`
+        hook is called before the file is closed.
+
+        If a checkpoint journal is given, processed user ids are committed to it
+        right after each flush, together with the size of the temp file.
+        This allows to resume an interrupted dump exactly where it stopped.
+        The journal is removed once a complete dump is committed.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, out_file, exporter, exporter_context,
+                 temp_files_list=None, checkpoint=None, batch_size=1000, metrics=None):
+        """ constructor
+            :param out_file:         Path of the resulting file
+            :param exporter:         Exporter object, its `begin_final_file` hook writes a header
+            :param exporter_context: The context passed to the exporter
+            :param temp_files_list:  Temp file objects are registered here until committed
+            :param checkpoint:       Optional Checkpoint journal of processed users
+            :param batch_size:       Number of rows written at once
+            :param metrics:          Optional Metrics that record write time
+        """
+        self.logger = logging.getLogger(__name__)
+        self.out_file = out_file
+        self.temp_file = out_file + '.part'
+        self.exporter = exporter
+        self.exporter_context = exporter_context
+        self.temp_files_list = temp_files_list if temp_files_list is not None else []
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.metrics = metrics
+        # The number of rows written so far
+        self.count = 0
+        self._batch = []
+        self._file = None
+
+    def open(self, resume=False):
+        """ Creates the temp file and writes the file header.
+            :param resume: Continue an interrupted dump recorded in the checkpoint journal
+
+            :return: Set of ids of users processed by the interrupted dump
+        """
+        processed, size = set(), None
+        if resume and self.checkpoint is not None:
+            processed, size = self.checkpoint.load()
+            if size is not None and not os.path.exists(self.temp_file) \
+                    and os.path.exists(self.out_file):
+                # The interrupted dump has been committed. Reopen it for appending.
+                os.replace(self.out_file, self.temp_file)
+            if size is None or not os.path.exists(self.temp_file):
+                self.logger.warning('Nothing to continue. Starting a new dump.')
+                processed, size = set(), None
+
+        if size is None:
+            self._file = open(self.temp_file, 'w', encoding='utf-8', newline='',
+                              buffering=WRITE_BUFFER_SIZE)
+        else:
+            # Drop rows written after the last commit to the journal
+            with open(self.temp_file, 'r+b') as part_file:
+                part_file.truncate(size)
+            self._file = open(self.temp_file, 'a', encoding='utf-8', newline='',
+                              buffering=WRITE_BUFFER_SIZE)
+        self.exporter_context.is_continue_mode = size is not None
+        self.temp_files_list.append(self._file)
+        if self.checkpoint is not None:
+            self.checkpoint.open(resume=size is not None)
+        self.exporter.begin_final_file(self._file, self.exporter_context)
+        return processed
+
+    def write(self, row, user_id=None):
+        """ Queues one formatted row, flushing a full batch to disk
+            :param row:     Formatted user
+            :param user_id: Id of the user, recorded as processed in the checkpoint journal
+        """
+        self._batch.append(row)
+        if user_id is not None and self.checkpoint is not None:
+            self.checkpoint.add(user_id)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def mark_processed(self, user_id):
+        """ Records that user has been processed but not written """
+        if self.checkpoint is not None:
+            self.checkpoint.add(user_id)
+            if len(self.checkpoint.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """ Writes the pending batch and pushes it to the OS """
+        started = time.perf_counter()
+        rows_count = len(self._batch)
+        if self._batch:
+            write_batch = getattr(self.exporter, 'write_batch', None)
+            if write_batch is not None:
+                write_batch(self._file, self._batch, self.exporter_context)
+            else:
+                self._file.write('\n'.join(self._batch))
+                self._file.write('\n')
+            self.count += len(self._batch)
+            self._batch.clear()
+        self._file.flush()
+        if self.checkpoint is not None:
+            self.checkpoint.commit(os.fstat(self._file.fileno()).st_size)
+        if self.metrics is not None:
+            self.metrics.observe('write_seconds', time.perf_counter() - started)
+            self.metrics.inc('written_rows_total', rows_count)
+
+    def commit(self, is_complete=False):
+        """ Flushes what's left and moves the temp file into place
+            :param is_complete: The dump went through all the users, so the checkpoint
+                                journal is removed as there is nothing to continue
+        """
+        if self._file is None:
+            return
+        self.flush()
+        end_final_file = getattr(self.exporter, 'end_final_file', None)
+        if end_final_file is not None:
+            end_final_file(self._file, self.exporter_context)
+        self._file.close()
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+        os.replace(self.temp_file, self.out_file)
+        self.temp_files_list.remove(self._file)
+        self._file = None
+        self.logger.debug('"%s" renamed into "%s".', self.temp_file, self.out_file)
+        if is_complete and self.checkpoint is not None:
+            self.checkpoint.remove()
+
+
+class NullWriter:
+    """ Writer of a run without a resulting file, e.g. a sample run.
+        It has the interface of OutputWriter and discards rows.
+    """
+
+    count = 0
+
+    def write(self, row, user_id=None):
+        pass
+
+    def mark_processed(self, user_id):
+        pass
+
+    def commit(self, is_complete=False):
+        pass
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" First stage filter applied to chat participants before their full profiles are fetched.
+
+    Expression syntax:
+        expr    := term ('or' term)*
+        term    := factor ('and' factor)*
+        factor  := 'not' factor | '(' expr ')' | field [op value]
+        op      := '=' | '!=' | '~' | '!~'
+        value   := 'quoted string' | "quoted string" | word
+
+    A field without an operator is tested for being non-empty/true.
+    '~' and '!~' search the field for a regular expression.
+
+    Examples:
+        not bot and not deleted
+        username and status = recently
+        (first_name ~ '^Jo' or username ~ dev) and not scam
+"""
+
+import re
+
+# Participant fields available in expressions
+FIELDS = {
+    'id': lambda user: user.id,
+    'username': lambda user: user.username,
+    'first_name': lambda user: user.first_name,
+    'last_name': lambda user: user.last_name,
+    'name': lambda user: ' '.join(x for x in (user.first_name, user.last_name) if x),
+    'phone': lambda user: user.phone,
+    'bot': lambda user: user.bot,
+    'deleted': lambda user: user.deleted,
+    'verified': lambda user: user.verified,
+    'scam': lambda user: user.scam,
+    'fake': lambda user: getattr(user, 'fake', None),
+    'contact': lambda user: user.contact,
+    'photo': lambda user: user.photo is not None,
+    'status': lambda user: status_name(user.status),
+}
+
+# telethon.tl.types.UserStatus* class names -> value of the 'status' field
+_STATUS_NAMES = {
+    'UserStatusOnline': 'online',
+    'UserStatusOffline': 'offline',
+    'UserStatusRecently': 'recently',
+    'UserStatusLastWeek': 'last_week',
+    'UserStatusLastMonth': 'last_month',
+    'UserStatusEmpty': 'long_ago',
+}
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<op>!=|!~|=|~|\(|\)) |
+    '(?P<squoted>(?:[^'\\]|\\.)*)' |
+    "(?P<dquoted>(?:[^"\\]|\\.)*)" |
+    (?P<word>[^\s()=~!'"]+)
+)""", re.VERBOSE)
+
+
+def status_name(status):
+    """ Returns short name of telethon.tl.types.UserStatus* object """
+    if status is None:
+        return 'long_ago'
+    return _STATUS_NAMES.get(type(status).__name__, 'long_ago')
+
+
+class ParticipantFilter:
+    """ Compiled participant filter expression.
+        Call it with a telethon.tl.types.User object to test the user.
+    """
+
+    def __init__(self, expression, flags=0):
+        """ constructor
+            :param expression: Filter expression, see module docstring
+            :param flags:      re flags used for '~' and '!~' operators
+
+            :raises ValueError: if expression is invalid
+        """
+        self.expression = expression
+        self.flags = flags
+        self._tokens = self._tokenize(expression)
+        self._pos = 0
+        self._predicate = self._parse_expr()
+        if self._pos != len(self._tokens):
+            raise ValueError('Unexpected "{}" in filter expression.'.format(
+                self._tokens[self._pos][1]))
+
+    def __call__(self, user):
+        return bool(self._predicate(user))
+
+    @staticmethod
+    def _tokenize(expression):
+        tokens = []
+        pos = 0
+        expression = expression.rstrip()
+        while pos < len(expression):
+            match = _TOKEN.match(expression, pos)
+            if not match or match.end() == pos:
+                raise ValueError('Invalid filter expression near "{}".'.format(
+                    expression[pos:]))
+            pos = match.end()
+            if match.group('op'):
+                tokens.append(('op', match.group('op')))
+            elif match.group('word') is not None:
+                tokens.append(('word', match.group('word')))
+            else:
+                quoted = match.group('squoted')
+                if quoted is None:
+                    quoted = match.group('dquoted')
+                tokens.append(('string', re.sub(r'\\(.)', r'\1', quoted)))
+        return tokens
+
+    def _peek(self):
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise ValueError('Unexpected end of filter expression.')
+        self._pos += 1
+        return token
+
+    def _parse_expr(self):
+        terms = [self._parse_term()]
+        while self._peek() == ('word', 'or'):
+            self._pos += 1
+            terms.append(self._parse_term())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda user: any(term(user) for term in terms)
+
+    def _parse_term(self):
+        factors = [self._parse_factor()]
+        while self._peek() == ('word', 'and'):
+            self._pos += 1
+            factors.append(self._parse_factor())
+        if len(factors) == 1:
+            return factors[0]
+        return lambda user: all(factor(user) for factor in factors)
+
+    def _parse_factor(self):
+        kind, value = self._next()
+        if (kind, value) == ('word', 'not'):
+            factor = self._parse_factor()
+            return lambda user: not factor(user)
+        if (kind, value) == ('op', '('):
+            expr = self._parse_expr()
+            if self._next() != ('op', ')'):
+                raise ValueError('Missing ")" in filter expression.')
+            return expr
+        if kind != 'word' or value not in FIELDS:
+            raise ValueError('Unknown participant field "{}". Available fields: {}'.format(
+                value, ', '.join(sorted(FIELDS))))
+        getter = FIELDS[value]
+
+        kind, op = self._peek()
+        if kind != 'op' or op not in ('=', '!=', '~', '!~'):
+            return getter
+        self._pos += 1
+        kind, operand = self._next()
+        if kind not in ('word', 'string'):
+            raise ValueError('Missing value after "{}" in filter expression.'.format(op))
+
+        if op in ('~', '!~'):
+            try:
+                pattern = re.compile(operand, self.flags)
+            except re.error as ex:
+                raise ValueError('Invalid regular expression "{}". {}'.format(operand, ex))
+            matches = lambda user: pattern.search(_to_str(getter(user))) is not None
+        else:
+            if self.flags & re.IGNORECASE:
+                operand = operand.casefold()
+                matches = lambda user: _to_str(getter(user)).casefold() == operand
+            else:
+                matches = lambda user: _to_str(getter(user)) == operand
+        if op.startswith('!'):
+            return lambda user: not matches(user)
+        return matches
+
+
+def _to_str(value):
+    """ Field value as compared in expressions """
+    if value is None or value is False:
+        return ''
+    if value is True:
+        return 'true'
+    return str(value)
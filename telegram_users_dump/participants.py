@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Participants stage of the dump pipeline.
+    Streams chat members, sharding server-side search for big groups.
+"""
+
+import asyncio
+import logging
+import string
+from telethon import functions, types, utils
+
+# Max number of participants returned by one GetParticipantsRequest
+PAGE_SIZE = 200
+
+# Telegram returns at most about 10k members for one search query.
+# A shard that reaches this size is split into longer query prefixes.
+SHARD_CAP = 10000
+
+# Characters appended to a query prefix when a shard gets split.
+SHARD_ALPHABET = string.ascii_lowercase + string.digits + \
+    'абвгґдеєжзиіїйклмнопрстуфхцчшщъыьэюя'
+
+
+class ParticipantEnumerator:
+    """ Enumerates chat participants as a stream.
+
+        For channels and megagroups the member search is sharded over query
+        prefixes ('' -> 'a', 'b', ... -> 'aa', 'ab', ...). A shard is only split
+        when it hits the listing cap, so small groups cost the same requests as before.
+        Shards are fetched concurrently and users are deduplicated by id,
+        keeping just a set of ints in memory rather than the user objects.
+
+        Names starting with a character out of SHARD_ALPHABET (emoji, other
+        scripts) fall out of the split shards. So when the listing ends up short
+        of the participants count, the recent members list is fetched as a
+        fallback pass, and what is still missing is reported.
+    """
+
+    def __init__(self, client, rate_limiter, concurrency=1):
+        """ constructor
+            :param client:       Connected TelegramClient used to send requests
+            :param rate_limiter: RateLimiter that schedules requests
+            :param concurrency:  Max number of shards fetched at once
+        """
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.concurrency = max(1, concurrency)
+        # Participants count as reported by the server. Known after `count()`
+        self.total = None
+        self.pages_count = 0
+        self._seen = set()
+        self._is_split = False
+
+    async def count(self, entity):
+        """ Resolves the number of participants of entity """
+        input_entity = await self.client.get_input_entity(entity)
+        if isinstance(input_entity, types.InputPeerChannel):
+            full = await self.rate_limiter.call(
+                self.client, functions.channels.GetFullChannelRequest(input_entity))
+            self.total = full.full_chat.participants_count
+        else:
+            self.total = (await self.client.get_participants(entity, limit=0)).total
+        return self.total
+
+    async def enumerate(self, entity):
+        """ Async generator of unique telethon.tl.types.User participants of entity """
+        input_entity = await self.client.get_input_entity(entity)
+        if not isinstance(input_entity, types.InputPeerChannel):
+            # Basic groups return all members at once
+            async for user in self.client.iter_participants(input_entity):
+                if user.id not in self._seen:
+                    self._seen.add(user.id)
+                    yield user
+            return
+
+        channel = utils.get_input_channel(input_entity)
+        shards = asyncio.Queue()
+        # Bounded, so that listing can't run far ahead of the consumer
+        users = asyncio.Queue(maxsize=PAGE_SIZE * self.concurrency)
+        shards.put_nowait('')
+        workers = [asyncio.ensure_future(self._shard_worker(channel, shards, users))
+                   for _ in range(self.concurrency)]
+        # Tells when all shards (including the ones split on the way) are done
+        all_done = asyncio.ensure_future(shards.join())
+        try:
+            while True:
+                getter = asyncio.ensure_future(users.get())
+                await asyncio.wait([getter, all_done, *workers],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                for worker in workers:
+                    if worker.done() and worker.exception() is not None:
+                        getter.cancel()
+                        raise worker.exception()
+                if not getter.done():
+                    getter.cancel()
+                    if users.empty():
+                        break
+                    continue
+                user = getter.result()
+                if user.id not in self._seen:
+                    self._seen.add(user.id)
+                    yield user
+        finally:
+            all_done.cancel()
+            for worker in workers:
+                worker.cancel()
+
+        if self._is_split and self._is_short():
+            self.logger.debug('Sharded listing returned %d of %d members, '
+                              'fetching recent members.', len(self._seen), self.total)
+            async for user in self._fetch_pages(channel, types.ChannelParticipantsRecent()):
+                if user.id not in self._seen:
+                    self._seen.add(user.id)
+                    yield user
+        if self._is_short():
+            self.logger.warning('Only %d of %d members could be listed. Telegram doesn\'t '
+                                'list the rest by any of the searched name prefixes.',
+                                len(self._seen), self.total)
+
+    def _is_short(self):
+        """ Tells whether fewer users were listed than the server reports """
+        return self.total is not None and len(self._seen) < self.total
+
+    async def _shard_worker(self, channel, shards, users):
+        """ Fetches queued shards page by page, pushing users into `users` """
+        while True:
+            query = await shards.get()
+            try:
+                fetched = await self._fetch_shard(channel, query, users)
+                if fetched >= SHARD_CAP:
+                    self.logger.debug('Shard "%s" hit the listing cap, splitting it.', query)
+                    self._is_split = True
+                    for char in SHARD_ALPHABET:
+                        shards.put_nowait(query + char)
+            finally:
+                shards.task_done()
+
+    async def _fetch_shard(self, channel, query, users):
+        """ Fetches all pages of one search query.
+            :return: Number of participants returned by the server
+        """
+        fetched = 0
+        async for user in self._fetch_pages(channel, types.ChannelParticipantsSearch(query)):
+            await users.put(user)
+            fetched += 1
+        return fetched
+
+    async def _fetch_pages(self, channel, participants_filter):
+        """ Async generator of users of all pages of one participants listing """
+        offset = 0
+        while True:
+            result = await self.rate_limiter.call(
+                self.client, functions.channels.GetParticipantsRequest(
+                    channel, participants_filter,
+                    offset=offset, limit=PAGE_SIZE, hash=0))
+            self.pages_count += 1
+            if not isinstance(result, types.channels.ChannelParticipants) \
+                    or not result.participants:
+                return
+            users_by_id = {user.id: user for user in result.users}
+            for participant in result.participants:
+                user = users_by_id.get(getattr(participant, 'user_id', None))
+                if user is not None:
+                    yield user
+            offset += len(result.participants)
+            if len(result.participants) < PAGE_SIZE:
+                return
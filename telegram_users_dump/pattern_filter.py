@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Second stage filter applied to full profiles: a set of regular expressions.
+
+    Pattern syntax (-f, --exclude and lines of --patterns-file):
+        [field:]regex
+
+    Without a field prefix the pattern is searched in the bio.
+    Fields: about, username, first_name, last_name, name, phone.
+
+    In a patterns file every line is an include pattern, unless it starts
+    with '!' which makes it an exclude pattern. Empty lines and lines
+    starting with '#' are skipped.
+
+    A user passes if any include pattern matches (or there are none)
+    and no exclude pattern matches.
+"""
+
+import re
+
+# Profile fields patterns can target
+FIELDS = {
+    'about': lambda record: record.about,
+    'username': lambda record: record.username,
+    'first_name': lambda record: record.first_name,
+    'last_name': lambda record: record.last_name,
+    'name': lambda record: ' '.join(x for x in (record.first_name, record.last_name) if x),
+    'phone': lambda record: record.phone,
+}
+
+# Field searched by patterns without a field prefix
+DEFAULT_FIELD = 'about'
+
+_FIELD_PREFIX = re.compile(r'^({}):'.format('|'.join(FIELDS)))
+
+# Group references that would point to wrong groups in a joined regex
+_GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?P[<=]|\(\?\(')
+
+# Inline global flags, e.g. (?i), which are only allowed at the start of a regex
+_GLOBAL_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')
+
+
+class PatternFilter:
+    """ Compiled set of include and exclude patterns.
+
+        Patterns targeting the same field are joined into one alternation,
+        so each field of a profile is scanned once no matter how many patterns
+        there are. Only when that scan hits, the patterns are tried one by one
+        to find out which of them matched.
+    """
+
+    def __init__(self, include=(), exclude=(), flags=0):
+        """ constructor
+            :param include: Include patterns, see module docstring
+            :param exclude: Exclude patterns
+            :param flags:   re flags of all patterns
+
+            :raises ValueError: if a pattern is invalid
+        """
+        # A lone match-all pattern (the default -f) filters nothing.
+        # Next to other patterns it is kept, so that every user passes.
+        self.include = list(include)
+        if all(pattern in ('', '.*') for pattern in self.include):
+            self.include = []
+        self.exclude = list(exclude)
+        self.flags = flags
+        self._include = _compile(self.include, flags)
+        self._exclude = _compile(self.exclude, flags)
+
+    @classmethod
+    def from_file(cls, path, include=(), exclude=(), flags=0):
+        """ Creates a filter out of a patterns file plus patterns given explicitly.
+            :raises OSError: if the file can't be read
+        """
+        include = list(include)
+        exclude = list(exclude)
+        with open(path, encoding='utf-8') as patterns_file:
+            for line in patterns_file:
+                line = line.rstrip('\r\n')
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                if line.startswith('!'):
+                    exclude.append(line[1:])
+                else:
+                    include.append(line)
+        return cls(include, exclude, flags)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """ Creates a filter out of -f, --exclude, --patterns-file and -i options
+            :raises OSError: if the patterns file can't be read
+        """
+        flags = re.IGNORECASE if settings.ignore_case else 0
+        if settings.patterns_file:
+            return cls.from_file(settings.patterns_file, settings.filters,
+                                 settings.excludes, flags)
+        return cls(settings.filters, settings.excludes, flags)
+
+    @property
+    def is_multi_pattern(self):
+        """ Whether there is more than one include pattern to tell apart in the output """
+        return len(self.include) > 1
+
+    def include_patterns(self):
+        """ Iterates over include patterns
+            :return: Iterator of (source, field, compiled regex) tuples
+        """
+        for source in self.include:
+            field, regex = _split(source)
+            yield source, field, re.compile(regex, self.flags)
+
+    def match(self, record):
+        """ Tests a profile.
+            :param record: UserRecord object
+
+            :return: List of include patterns that matched (empty if there are none)
+                     or None if the user doesn't pass the filter
+        """
+        for getter, combined, _ in self._exclude:
+            if combined.search(getter(record) or '') is not None:
+                return None
+        if not self._include:
+            return []
+        matched = []
+        for getter, combined, patterns in self._include:
+            value = getter(record) or ''
+            if combined.search(value) is None:
+                continue
+            if len(patterns) == 1:
+                matched.append(patterns[0][0])
+            else:
+                matched.extend(source for source, pattern in patterns
+                               if pattern.search(value) is not None)
+        return matched or None
+
+
+def _split(source):
+    """ Splits a pattern into (field, regex) """
+    prefix = _FIELD_PREFIX.match(source)
+    if prefix is None:
+        return DEFAULT_FIELD, source
+    return prefix.group(1), source[prefix.end():]
+
+
+def _compile(sources, flags):
+    """ Groups patterns by field and compiles a combined regex per field.
+        :return: list of (field getter, combined regex, [(source, regex)]) tuples
+    """
+    by_field = {}
+    for source in sources:
+        field, regex = _split(source)
+        try:
+            by_field.setdefault(field, []).append((source, re.compile(regex, flags)))
+        except re.error as ex:
+            raise ValueError('Invalid regular expression "{}". {}'.format(source, ex))
+
+    compiled = []
+    for field, patterns in by_field.items():
+        if len(patterns) == 1:
+            combined = patterns[0][1]
+        elif any(_GROUP_REFERENCE.search(pattern.pattern)
+                 or _GLOBAL_FLAGS.search(pattern.pattern) for _, pattern in patterns):
+            # Backreferences, named groups and global flags don't survive joining
+            combined = _AnyOf([pattern for _, pattern in patterns])
+        else:
+            try:
+                combined = re.compile('|'.join('(?:{})'.format(pattern.pattern)
+                                               for _, pattern in patterns), flags)
+            except re.error:
+                combined = _AnyOf([pattern for _, pattern in patterns])
+        compiled.append((FIELDS[field], combined, patterns))
+    return compiled
+
+
+class _AnyOf:
+    """ Fallback of a combined regex: tries patterns one by one """
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+
+    def search(self, value):
+        for pattern in self.patterns:
+            match = pattern.search(value)
+            if match is not None:
+                return match
+        return None
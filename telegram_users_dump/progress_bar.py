@@ -2,28 +2,150 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import time
+import queue
+import threading
+
+# Seconds between redraws of the bar on a terminal
+TTY_INTERVAL = 0.25
+# Seconds between progress lines when output is redirected into a file or pipe
+LOG_INTERVAL = 10.0
+# Smoothing factor of the moving average throughput the ETA is based on
+EMA_ALPHA = 0.3
+
 
 class ProgressBar:
+    """ Progress of a dump.
+
+        On a terminal the bar is redrawn in place at most every TTY_INTERVAL seconds.
+        When stdout is redirected, a 'progress' line of key=value pairs with
+        throughput and ETA is printed every LOG_INTERVAL seconds instead.
+        `progress()` only checks the clock between redraws, and the output
+        is written by a background thread, so a slow stdout never stalls the caller.
+    """
 
-    def __init__(self, title, size):
+    def __init__(self, title, size, stream=None, interval=None):
+        """ constructor
+            :param title:    Title of the bar
+            :param size:     Expected number of processed items
+            :param stream:   Output stream. (Default: stdout)
+            :param interval: Seconds between updates. (Default: depends on whether
+                             the stream is a terminal)
+        """
         self.pattern = "{}: {:<1d}/{:<1d} Found: {:<3d} [{}{}]"
         self.title = title
         self.size = size
-
+        self.stream = stream if stream is not None else sys.stdout
+        try:
+            self.is_tty = self.stream.isatty()
+        except (AttributeError, ValueError):
+            self.is_tty = False
+        self.interval = interval if interval is not None else \
+            TTY_INTERVAL if self.is_tty else LOG_INTERVAL
+        self._started = None
+        self._next_draw = 0.0
+        self._last_time = None
+        self._last_x = 0
+        self._speed = None
+        self._line_length = 0
+        self._lines = queue.Queue(maxsize=1)
+        self._writer = None
 
     def startProgress(self):
-        # digits_count = len(str(size))
-        out_str = self.pattern.format(self.title, 0, self.size, 0, "", "-"*40)
-        sys.stdout.write(out_str + chr(8)*len(out_str))
-        sys.stdout.flush()
+        self._started = self._last_time = time.monotonic()
+        self._next_draw = self._started + self.interval
+        self._writer = threading.Thread(target=self._write_lines, daemon=True)
+        self._writer.start()
+        if self.is_tty:
+            self._draw(self.pattern.format(self.title, 0, self.size, 0, "", "-"*40))
 
-    def progress(self, x, found):
-        filled = int((x / self.size * 4000) // 100)
-        out_str = self.pattern.format(self.title, x, self.size, found, "#"*filled, "-"*(40-filled))
-        sys.stdout.write(out_str + chr(8)*len(out_str))
-        sys.stdout.flush()
+    def progress(self, x, found, rate=None):
+        now = time.monotonic()
+        if now < self._next_draw:
+            return
+        self._next_draw = now + self.interval
+        self._update_speed(now, x)
+        eta = None
+        if self._speed and self.size > x:
+            eta = (self.size - x) / self._speed
+        if self.is_tty:
+            filled = min(40, int((x / max(1, self.size) * 4000) // 100))
+            out_str = self.pattern.format(self.title, x, self.size, found,
+                                          "#"*filled, "-"*(40-filled))
+            out_str += " {:.1f} users/s".format(self._speed or 0.0)
+            if rate is not None:
+                out_str += " {:.1f} req/s".format(rate)
+            if eta is not None:
+                out_str += " ETA {}".format(_format_duration(eta))
+            self._draw(out_str)
+        else:
+            fields = [('processed', x), ('total', self.size), ('found', found),
+                      ('users_per_sec', '{:.1f}'.format(self._speed or 0.0))]
+            if rate is not None:
+                fields.append(('req_per_sec', '{:.1f}'.format(rate)))
+            if eta is not None:
+                fields.append(('eta_sec', int(eta)))
+            self._put('progress ' + ' '.join('{}={}'.format(*field) for field in fields) + '\n')
 
     def endProgress(self, found):
-        out_str = self.pattern.format(self.title, self.size, self.size, found, "#"*40, "")
-        sys.stdout.write(out_str + "\n")
-        sys.stdout.flush()
\ No newline at end of file
+        if self._writer is None:
+            self.startProgress()
+        elapsed = time.monotonic() - self._started
+        if self.is_tty:
+            out_str = self.pattern.format(self.title, self.size, self.size, found, "#"*40, "")
+            self._draw(out_str, end="\n")
+        else:
+            self._put('progress done=1 total={} found={} elapsed_sec={:.1f}\n'.format(
+                self.size, found, elapsed), block=True)
+        self._put(None, block=True)
+        self._writer.join()
+
+    def _update_speed(self, now, x):
+        """ Updates the moving average number of items per second """
+        if now > self._last_time:
+            speed = (x - self._last_x) / (now - self._last_time)
+            self._speed = speed if self._speed is None else \
+                EMA_ALPHA * speed + (1 - EMA_ALPHA) * self._speed
+        self._last_time = now
+        self._last_x = x
+
+    def _draw(self, out_str, end=""):
+        """ Redraws the bar in place, wiping leftovers of a longer previous one """
+        padding = " " * max(0, self._line_length - len(out_str))
+        self._line_length = len(out_str)
+        self._put("\r" + out_str + padding + end, block=bool(end))
+
+    def _put(self, line, block=False):
+        """ Hands a line over to the writer thread.
+            A non-blocking update replaces the pending one if the stream is behind.
+        """
+        if block:
+            self._lines.put(line)
+            return
+        try:
+            self._lines.put_nowait(line)
+        except queue.Full:
+            try:
+                self._lines.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._lines.put_nowait(line)
+            except queue.Full:
+                pass
+
+    def _write_lines(self):
+        while True:
+            line = self._lines.get()
+            if line is None:
+                return
+            try:
+                self.stream.write(line)
+                self.stream.flush()
+            except (OSError, ValueError, UnicodeEncodeError):
+                pass
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Adaptive request scheduler that sits between the dumper and the client. """
+
+import asyncio
+import logging
+import time
+from telethon.errors import FloodWaitError
+
+
+class RateLimiter:
+    """ Token bucket whose refill rate is adjusted with AIMD
+        (additive increase, multiplicative decrease).
+
+        * Until the first congestion signal the rate grows exponentially (slow start).
+          After that every successful request nudges the rate up a little.
+        * A FloodWaitError halves the rate and blocks all requests
+          for the number of seconds requested by the server. Flood waits
+          of other requests that arrive during the block are the same event
+          and don't lower the rate again.
+        * Growing response latency is treated as an early congestion
+          signal, so the rate is lowered before the server has to push back.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, rate=5.0, max_rate=20.0, min_rate=0.2, metrics=None, account=''):
+        """ constructor
+            :param rate:     Initial number of requests per second
+            :param max_rate: Upper bound of the rate
+            :param min_rate: Lower bound of the rate
+            :param metrics:  Optional Metrics that record latency of requests and flood waits
+            :param account:  Name of the account in metrics
+        """
+        self.logger = logging.getLogger(__name__)
+        self.metrics = metrics
+        self.account = account
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max(self.min_rate, min(rate, max_rate))
+        # Rate at which the last flood wait was received. Growth slows down near it.
+        self.ceiling = max_rate
+        self.flood_waits_count = 0
+        self.is_slow_start = True
+
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        # Latency tracking for early slow down
+        self._min_latency = None
+        self._avg_latency = None
+        self._last_decrease = 0.0
+
+    async def acquire(self):
+        """ Waits until a request may be sent """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    async def call(self, client, request, retry_flood_waits=True):
+        """ Sends request through the client once allowed,
+            retrying it after flood waits.
+            :param retry_flood_waits: If False, FloodWaitError is registered and re-raised,
+                                      so that the caller can send the request elsewhere
+        """
+        method = type(request).__name__
+        while True:
+            waiting_since = time.monotonic()
+            await self.acquire()
+            started = time.monotonic()
+            if self.metrics is not None:
+                self.metrics.observe('rate_limiter_wait_seconds', started - waiting_since,
+                                     account=self.account)
+            try:
+                result = await client(request)
+            except FloodWaitError as ex:
+                self.logger.debug('%s hit a flood wait of %s seconds.', method, ex.seconds)
+                if self.metrics is not None:
+                    self.metrics.inc('flood_waits_total', method=method, account=self.account)
+                    self.metrics.inc('flood_wait_seconds_total', ex.seconds,
+                                     account=self.account)
+                self.on_flood_wait(ex.seconds)
+                if not retry_flood_waits:
+                    raise
+                continue
+            latency = time.monotonic() - started
+            if self.metrics is not None:
+                self.metrics.observe('rpc_seconds', latency, method=method, account=self.account)
+            self.on_success(latency)
+            return result
+
+    def on_success(self, latency):
+        """ Registers a successfully completed request.
+            :param latency: Request round-trip time in seconds
+        """
+        if self._min_latency is None or latency < self._min_latency:
+            self._min_latency = latency
+        if self._avg_latency is None:
+            self._avg_latency = latency
+        else:
+            self._avg_latency = 0.9 * self._avg_latency + 0.1 * latency
+
+        now = time.monotonic()
+        if self._avg_latency > 2 * self._min_latency + 0.05 \
+                and now - self._last_decrease > 1.0:
+            # Server answers slower and slower: back off a bit
+            self._set_rate(self.rate * 0.9)
+            self._last_decrease = now
+            self.is_slow_start = False
+            return
+
+        if self.is_slow_start:
+            # About +50% per second
+            self._set_rate(self.rate + 0.5)
+            return
+
+        # Additive increase: about +1 req/s per second of full-speed operation,
+        # but much more careful when approaching the last known flood point.
+        step = 1.0 / self.rate
+        if self.rate >= 0.9 * self.ceiling:
+            step *= 0.1
+        self._set_rate(self.rate + step)
+
+    def on_flood_wait(self, seconds):
+        """ Registers a FloodWaitError.
+            :param seconds: Number of seconds the server asked to wait
+        """
+        self.flood_waits_count += 1
+        self.is_slow_start = False
+        now = time.monotonic()
+        if now < self._blocked_until:
+            # Another request that was in flight when the flood wait hit:
+            # the same event, the rate has already been lowered for it
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            return
+        self.ceiling = self.rate
+        self._set_rate(self.rate * 0.5)
+        self._blocked_until = now + seconds
+        self._tokens = 0.0
+        self.logger.info('Flood wait of %s seconds. Rate lowered to %.2f req/s',
+                         seconds, self.rate)
+
+    def blocked_for(self):
+        """ Number of seconds left till the end of the current flood wait """
+        return max(0.0, self._blocked_until - time.monotonic())
+
+    def _refill(self, now):
+        """ Adds tokens accumulated since the last refill """
+        # Bucket capacity of one second worth of requests allows short bursts
+        capacity = max(1.0, self.rate)
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _set_rate(self, rate):
+        self.rate = max(self.min_rate, min(rate, self.max_rate))
@@ -3,57 +3,300 @@
 
 """
 Usage:
-telegram_users_dump -c <chat_name> -p <phone_num> [-f <filter>] [-o <file>]
+telegram_users_dump -c <chat_name> -p <phone_num> [-w <expr>] [-f <filter>] [-o <file>]
+telegram_users_dump export <archive> [-f <filter>] [-e <exporter>] [-o <file>] [-j <jobs>]
+telegram_users_dump daemon -p <phone_num> [--socket <path>]
+telegram_users_dump submit [--priority <n>] [--overwrite] [--detach] -c <chat_name> [<dump options>]
+telegram_users_dump jobs [<job id>] [--cancel <job id>]
+telegram_users_dump query <store> [-f <filter>] [-c <chat_name>] [-m <query>] [-e <exporter>] [-o <file>]
+telegram_users_dump exporters
 
 Where:
     -c,  --chat         Unique name of a channel/chat. E.g. @python.
+                        Can be repeated to dump several chats in one session.
+         --chats-file   File with a list of chats to dump, one per line.
     -p,  --phone        Phone number. E.g. +380503211234.
-    -f,  --filter       Filter using regular expression
+                        Can be repeated: extra accounts share full-profile requests
+                        with the first one. They must have access to the chats.
+    -f,  --filter       Filter using regular expression, searched in the bio.
+                        A field: prefix searches another field instead, e.g. username:^dev.
+                        Fields: about, username, first_name, last_name, name, phone.
+                        Can be repeated: a user matching any pattern is dumped, and
+                        a Matched column lists the patterns the user matched.
+         --exclude      Skip users matching this regular expression. Same syntax as -f.
+                        Can be repeated.
+         --patterns-file
+                        File with patterns, one per line. Lines starting with ! are
+                        exclude patterns, lines starting with # are comments.
     -i,  --ignore_case  Ignore case while filtering
+    -w,  --where        Filter participants before fetching their full profiles.
+                        E.g. "not bot and not deleted and status = recently".
+                        Fields: id, username, first_name, last_name, name, phone,
+                        bot, deleted, verified, scam, fake, contact, photo, status.
+                        Operators: and, or, not, =, !=, ~ (regex), !~.
     -o,  --out          Output file name or full path. (Default: telegram_<chatName>.log)
-    -e,  --exp          Exporter name. text | json | csv (Default: 'csv')
+                        With several chats it must contain {} placeholder for the chat name.
+    -e,  --exp          Exporter name. text | json | csv | stdcsv | parquet | arrow | archive
+                        or an installed plugin, see 'exporters' command. (Default: 'csv')
+                        'archive' stores raw profiles to be re-exported offline with
+                        'export' command. Leave -f empty to archive every profile.
+         --limit        Stop once this many users are written into a chat's resulting file.
+                        The dump can be resumed with --continue. (Default: no limit)
+         --time-budget  Stop fetching when the run takes this long. E.g. 90, 30m or 2h.
+                        Users fetched so far are written. (Default: no limit)
+         --order        Order full profiles are requested in. listing | likely
+                        'likely' requests users seen online recently, with a username
+                        and a photo first, bots and deleted accounts last. Useful with --limit.
+                        (Default: listing)
+         --sample       Estimate a dump instead of doing it. Fetches full profiles of
+                        a uniform random sample of participants, a number or a percentage
+                        (e.g. 1000 or 1%), and reports the estimated number of matches
+                        with a 95% confidence interval and the projected dump duration.
+         --write-sample Write the sampled matches into the resulting file.
+         --concurrency  Number of full-profile requests kept in flight. (Default: 4)
+         --max-rate     Upper bound of requests per second. The actual rate adapts
+                        to flood waits and server latency. (Default: 20)
+         --continue     Continue an interrupted dump: skip users processed by it
+                        and append to its output file.
+         --since-snapshot
+                        Incremental dump. Writes only users added, changed or removed
+                        since the previous dump, with an operation column. The snapshot
+                        of the chat is kept in this file. Users whose names and phone
+                        didn't change are not requested again.
+                        With several chats it must contain {} placeholder for the chat name.
+         --store        Path to a searchable store of profiles. Every fetched profile,
+                        matching or not, and the chats it was seen in are saved there
+                        to be searched offline with 'query' command.
+         --cache        Path to a local cache of user profiles. Only users missing
+                        in it or with stale entries are requested from Telegram.
+         --cache-ttl    Hours a cached profile stays fresh. (Default: 168)
+         --cache-size   Max number of cached profiles, least recently used
+                        ones are evicted. (Default: 1000000)
+         --stats        Path to a file metrics are written into: request latency,
+                        flood waits, time spent in filters, exporter and writes.
+         --stats-format
+                        json (a stats line appended every interval) | prometheus
+                        (text file for node_exporter's textfile collector). (Default: json)
+         --stats-interval
+                        Seconds between stats reports. (Default: 10)
+         --profile      Profile the run. Writes cProfile stats into this file or,
+                        if it ends with .html and pyinstrument is installed, its report.
+         --csv-dialect  Dialect of 'stdcsv' exporter. excel | excel-tab | unix
+                        (Default: excel)
+         --csv-quoting  Quoting of 'stdcsv' exporter. minimal | all | nonnumeric | none
+                        (Default: minimal)
     -h,  --help         Show this help message and exit.
 """
 
+# Only what parsing the arguments needs is imported here. Telethon and the
+# dump pipeline are imported once a dump starts, the offline commands import
+# their own modules, so that --help and argument errors are instant.
 import os
 import sys
-import importlib
-from telegram_users_dump.telegram_dumper import TelegramDumper
-from telegram_users_dump.chat_dump_settings import ChatDumpSettings
+from telegram_users_dump import exporters
+from telegram_users_dump.chat_dump_settings import (ChatDumpSettings, ExportSettings,
+                                                    DaemonSettings, QuerySettings)
+from telegram_users_dump.exceptions import DumpingError
 from telegram_users_dump.utils import sprint
 
 
 
+DAEMON_USAGE = """
+Usage:
+telegram_users_dump daemon -p <phone_num> [--socket <path>]
+
+Keeps an authorized connection open and runs dump jobs submitted over a Unix socket
+by 'submit' command, one at a time, higher priority first.
+
+Where:
+    -p,  --phone        Phone number. Can be repeated to add worker accounts.
+         --socket       Path of the Unix socket. (Default: ~/.telegram_users_dump.sock)
+         --max-rate     Upper bound of requests per second. (Default: 20)
+         --cache        Path to a local cache of user profiles shared by the jobs.
+         --cache-ttl    Hours a cached profile stays fresh. (Default: 168)
+         --cache-size   Max number of cached profiles. (Default: 1000000)
+         --stats        Path to a file metrics of the jobs are written into.
+         --stats-format json | prometheus (Default: json)
+         --stats-interval
+                        Seconds between stats reports. (Default: 10)
+    -h,  --help         Show this help message and exit.
+
+Jobs:
+telegram_users_dump submit [--socket <path>] [--priority <n>] [--overwrite] [--detach] <dump options>
+    Queues a dump with the options of a regular dump, except -p, --cache, --stats and
+    --profile that are the daemon's. Prints status lines of the job as JSON until it's
+    over, unless --detach is given, and exits with its exit code.
+    --overwrite lets the job overwrite existing resulting files.
+telegram_users_dump jobs [--socket <path>] [<job id>] [--cancel <job id>]
+    Prints status of the jobs or cancels a queued job.
+"""
+
+
+EXPORT_USAGE = """
+Usage:
+telegram_users_dump export <archive> [-f <filter>] [-e <exporter>] [-o <file>] [-j <jobs>]
+
+Re-exports an archive written with '-e archive' without connecting to Telegram.
+
+Where:
+    -f,  --filter       Filter using regular expression. Same as in a dump.
+         --exclude      Skip users matching this regular expression.
+         --patterns-file
+                        File with patterns, one per line.
+    -i,  --ignore_case  Ignore case while filtering
+    -o,  --out          Output file name or full path. (Default: the archive name)
+    -e,  --exp          Exporter name. text | json | csv | stdcsv | parquet | arrow
+                        (Default: 'csv')
+    -j,  --jobs         Number of processes filtering and formatting the archive. (Default: 1)
+         --csv-dialect  Dialect of 'stdcsv' exporter. (Default: excel)
+         --csv-quoting  Quoting of 'stdcsv' exporter. (Default: minimal)
+    -h,  --help         Show this help message and exit.
+"""
+
+
+QUERY_USAGE = """
+Usage:
+telegram_users_dump query <store> [-f <filter>] [-c <chat_name>] [-m <query>] [-e <exporter>] [-o <file>]
+
+Searches the profile store written by dumps with --store without connecting to Telegram.
+
+Where:
+    -f,  --filter       Filter using regular expression. Same as in a dump.
+         --exclude      Skip users matching this regular expression.
+         --patterns-file
+                        File with patterns, one per line.
+    -i,  --ignore_case  Ignore case while filtering
+    -c,  --chat         Only users of this chat, as it was named in the dump.
+    -m,  --match        SQLite FTS5 query on username, first_name, last_name and about
+                        columns, e.g. 'about: "golang" NOT username: "bot"'.
+    -o,  --out          Output file name or full path, the extension is added.
+                        (Default: print the users)
+    -e,  --exp          Exporter name. text | json | csv | stdcsv | parquet | arrow | archive
+                        (Default: 'csv')
+         --limit        Stop after this many users. (Default: no limit)
+         --csv-dialect  Dialect of 'stdcsv' exporter. (Default: excel)
+         --csv-quoting  Quoting of 'stdcsv' exporter. (Default: minimal)
+    -h,  --help         Show this help message and exit.
+"""
+
+
 def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == 'export':
+        sys.exit(export(sys.argv[2:]))
+    if command == 'daemon':
+        sys.exit(daemon(sys.argv[2:]))
+    if command == 'query':
+        sys.exit(query(sys.argv[2:]))
+    if command == 'exporters':
+        sys.exit(list_exporters())
+    if command in ('submit', 'jobs'):
+        from telegram_users_dump import daemon_client
+        sys.exit(getattr(daemon_client, command)(sys.argv[2:]))
     settings = ChatDumpSettings(__doc__)
-    exporter = _load_exporter(settings.exporter)
-    settings.out_file += exporter.ext
-    sys.exit(TelegramDumper(os.path.basename(__file__), settings, exporter).run())
+    exporter = _create_exporter(settings)
+    for target in settings.chats:
+        target.out_file += exporter.ext
+    from telegram_users_dump.telegram_dumper import TelegramDumper
+    dumper = TelegramDumper(os.path.basename(__file__), settings, exporter)
+    if settings.profile_file:
+        sys.exit(_profile(dumper.run, settings.profile_file))
+    sys.exit(dumper.run())
 
-def _load_exporter(exporter_name):
-    """ Loads exporter from file <exporter_name>.py in ./exporters subfolder.
-        :param exporter_name:      name of exporter. E.g. 'text' or 'json'
+def export(argv):
+    """ Runs 'export' command: offline re-export of an archive """
+    settings = ExportSettings(EXPORT_USAGE, argv)
+    from telegram_users_dump.archive_export import ArchiveExporter
+    exporter = _create_exporter(settings)
+    settings.out_file += exporter.ext
+    try:
+        count = ArchiveExporter(settings, exporter).run()
+    except DumpingError as ex:
+        sprint("ERROR: %s" % ex)
+        return 1
+    sprint('{} users exported into "{}".'.format(count, settings.out_file))
+    return 0
 
-        :return: Exporter instance
+def query(argv):
+    """ Runs 'query' command: offline search of the profile store.
+        Messages go to stderr, so that found users can be printed.
     """
-    # By convention exporters are located in .\exporters subfolder
-    # COMMENT: Don't check file existance. It won't play well with pyinstaller bins
-    exporter_file_name = exporter_name + ".py"
-    exporter_rel_name = "telegram_users_dump.exporters." + exporter_name
-    # Load exporter from file
-    sprint("Try to load exporter '%s'...  " % (exporter_file_name), end='')
+    settings = QuerySettings(QUERY_USAGE, argv)
+    from telegram_users_dump.store_query import StoreQuery
+    exporter = _create_exporter(settings, file=sys.stderr)
+    if settings.out_file:
+        settings.out_file += exporter.ext
     try:
-        exporter_module = importlib.import_module(exporter_rel_name)
-        sprint("OK!")
-    except ModuleNotFoundError:
-        sprint("\nERROR: Failed to load exporter './exporters/%s'." % exporter_file_name)
-        exit(1)
+        count = StoreQuery(settings, exporter).run()
+    except DumpingError as ex:
+        sprint("ERROR: %s" % ex, file=sys.stderr)
+        return 1
+    if settings.out_file:
+        sprint('{} users written into "{}".'.format(count, settings.out_file), file=sys.stderr)
+    else:
+        sprint('{} users found.'.format(count), file=sys.stderr)
+    return 0
+
+def list_exporters():
+    """ Runs 'exporters' command: lists exporters without loading them """
+    for name, description in exporters.available().items():
+        sprint('{:<12} {}'.format(name, description))
+    return 0
+
+def daemon(argv):
+    """ Runs 'daemon' command """
+    settings = DaemonSettings(DAEMON_USAGE, argv)
+    from telegram_users_dump.daemon import DumpDaemon
+    return DumpDaemon(os.path.basename(__file__), settings, __doc__).serve()
 
+def _profile(func, profile_file):
+    """ Runs func under a profiler and saves the results into profile_file.
+        pyinstrument is used for .html files if it is installed, cProfile otherwise.
+
+        :return: What func returns
+    """
+    if profile_file.endswith('.html'):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            Profiler = None
+        if Profiler is not None:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                return func()
+            finally:
+                profiler.stop()
+                with open(profile_file, 'w', encoding='utf-8') as report_file:
+                    report_file.write(profiler.output_html())
+                sprint('Profile saved into "%s".' % profile_file)
+    import cProfile
+    profiler = cProfile.Profile()
     try:
-        exporterClass = getattr(exporter_module, exporter_name)
-    except AttributeError:
-        sprint("ERROR: Failed to load class '%s' out of './exporters/%s'." \
-               % (exporter_name, exporter_file_name))
-        exit(1)
+        return profiler.runcall(func)
+    finally:
+        profiler.dump_stats(profile_file)
+        sprint('Profile saved into "%s". Inspect it with: python -m pstats %s'
+               % (profile_file, profile_file))
 
-    return exporterClass()
\ No newline at end of file
+def _create_exporter(settings, file=None):
+    """ Loads the exporter chosen by -e and configures it. Exits if it fails.
+        :param settings: Settings object with `exporter` name and the options exporters read
+        :param file:     stream messages are printed to. (Default: stdout)
+
+        :return: Exporter instance
+    """
+    sprint("Try to load exporter '%s'...  " % settings.exporter, end='', file=file)
+    try:
+        exporter = exporters.create(settings.exporter)
+    except ValueError as ex:
+        sprint("\nERROR: %s" % ex, file=file)
+        sys.exit(1)
+    sprint("OK!", file=file)
+    if hasattr(exporter, 'configure'):
+        try:
+            exporter.configure(settings)
+        except ValueError as ex:
+            sprint("ERROR: %s" % ex, file=file)
+            sys.exit(1)
+    return exporter
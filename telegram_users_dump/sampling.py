@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Uniform random sample of participants to estimate the outcome of a full dump. """
+
+import math
+import time
+import random
+
+# z-score of the 95% confidence level
+Z_95 = 1.959964
+
+
+def parse_sample_size(value):
+    """ Parses --sample value: a number of users or a percentage of the chat.
+        :return: (number of users, fraction) tuple, one of them is None.
+                 None if value is invalid
+    """
+    value = value.strip()
+    try:
+        if value.endswith('%'):
+            fraction = float(value[:-1]) / 100
+            return (None, fraction) if 0 < fraction <= 1 else None
+        size = int(value)
+        return (size, None) if size > 0 else None
+    except ValueError:
+        return None
+
+
+class ParticipantSample:
+    """ Reservoir sample of a stream of participants.
+
+        Every participant of the stream has the same chance to get into the
+        sample, and only the sample is kept in memory. The whole participants
+        list is read before the sample is known, which costs one request
+        per 200 participants.
+    """
+
+    def __init__(self, size, rng=None):
+        """ constructor
+            :param size: Number of participants to draw
+            :param rng:  random.Random object. (Default: seeded by the OS)
+        """
+        self.size = size
+        self.rng = rng if rng is not None else random.Random()
+        # Number of participants the sample is drawn from
+        self.population = 0
+        # Seconds spent reading the participants list
+        self.listing_seconds = 0.0
+
+    async def draw(self, users):
+        """ Async generator of the sampled participants
+            :param users: Async iterable of telethon.tl.types.User objects
+        """
+        started = time.monotonic()
+        reservoir = []
+        randrange = self.rng.randrange
+        try:
+            async for user in users:
+                if len(reservoir) < self.size:
+                    reservoir.append(user)
+                else:
+                    index = randrange(self.population + 1)
+                    if index < self.size:
+                        reservoir[index] = user
+                self.population += 1
+        finally:
+            if hasattr(users, 'aclose'):
+                await users.aclose()
+        self.listing_seconds = time.monotonic() - started
+        for user in reservoir:
+            yield user
+
+
+def wilson_interval(successes, trials, population=None, z=Z_95):
+    """ Wilson score interval of a proportion.
+        :param successes:  Number of sampled items with the property
+        :param trials:     Sample size
+        :param population: Size of the population sampled without replacement.
+                           The finite population correction narrows the interval
+                           as the sample approaches the whole population.
+        :param z:          z-score of the confidence level
+
+        :return: (low, high) bounds of the proportion
+    """
+    if trials == 0:
+        return 0.0, 1.0
+    proportion = successes / trials
+    if population is not None and population > 1:
+        if trials >= population:
+            return proportion, proportion
+        # Effective sample size with the finite population correction
+        trials = trials * (population - 1) / (population - trials)
+    z2 = z * z
+    center = (proportion + z2 / (2 * trials)) / (1 + z2 / trials)
+    spread = z / (1 + z2 / trials) * math.sqrt(
+        proportion * (1 - proportion) / trials + z2 / (4 * trials * trials))
+    return max(0.0, center - spread), min(1.0, center + spread)
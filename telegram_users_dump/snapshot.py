@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Snapshot of a dumped chat used to produce incremental (delta) dumps. """
+
+import os
+import struct
+import hashlib
+import logging
+
+_MAGIC = b'TUDSNAP1'
+# Magic, fingerprint of the filters
+_HEADER = struct.Struct('<8sQ')
+# User id, hash of the fields known without a full profile request,
+# hash of all exported fields, whether the user matched the filters
+_RECORD = struct.Struct('<qQQ?')
+
+# Operations in the delta dump
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+
+
+class Snapshot:
+    """ Compact binary snapshot of a chat: one fixed-size record per user.
+
+        The previous snapshot is compared against profiles of the current dump.
+        Users whose cheap fields (the ones participants listing returns) didn't
+        change since the previous snapshot are taken as unchanged, without
+        a full profile request. The new snapshot replaces the previous one
+        only after a complete dump, so an interrupted dump can be repeated.
+    """
+
+    def __init__(self, path, fingerprint=0):
+        """ constructor
+            :param path:        Path to the snapshot file. It may not exist yet.
+            :param fingerprint: Hash of the filters. If they have changed since the
+                                previous snapshot, every user gets a full profile request.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.fingerprint = fingerprint
+        self.unchanged_count = 0
+        self.is_complete = False
+        self._previous = {}
+        self._current = {}
+        self._is_same_filters = False
+        self._load()
+
+    def is_unchanged(self, user):
+        """ Checks cheap fields of a participant against the previous snapshot.
+            An unchanged user is carried over into the new snapshot as is.
+            :param user: telethon.tl.types.User object as returned among chat participants
+        """
+        if not self._is_same_filters:
+            return False
+        entry = self._previous.get(user.id)
+        if entry is None or entry[0] != cheap_hash(user):
+            return False
+        self._current[user.id] = entry
+        self.unchanged_count += 1
+        return True
+
+    def update(self, record, matched):
+        """ Records a fetched profile.
+            :param record:  UserRecord object
+            :param matched: Whether the user matched the filters
+
+            :return: ADDED, CHANGED, REMOVED or None if the user is not a part of the delta
+        """
+        entry = (cheap_hash(record), full_hash(record), matched)
+        self._current[record.id] = entry
+        previous = self._previous.get(record.id)
+        was_matched = previous is not None and previous[2]
+        if matched and not was_matched:
+            return ADDED
+        if was_matched and not matched:
+            return REMOVED
+        if matched and previous[1] != entry[1]:
+            return CHANGED
+        return None
+
+    def finish(self):
+        """ Marks the dump as complete.
+            :return: Ids of previously matched users that are gone from the chat
+                     or have been filtered out before a full profile request
+        """
+        self.is_complete = True
+        return [user_id for user_id, entry in self._previous.items()
+                if entry[2] and user_id not in self._current]
+
+    def save(self):
+        """ Atomically replaces the snapshot file with the new snapshot """
+        if not self.is_complete:
+            return
+        temp_path = self.path + '.part'
+        with open(temp_path, 'wb') as snapshot_file:
+            snapshot_file.write(_HEADER.pack(_MAGIC, self.fingerprint))
+            pack = _RECORD.pack
+            snapshot_file.write(b''.join(pack(user_id, *entry)
+                                         for user_id, entry in self._current.items()))
+        os.replace(temp_path, self.path)
+        self.logger.debug('%s users saved into snapshot "%s".', len(self._current), self.path)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as snapshot_file:
+            data = snapshot_file.read()
+        if len(data) < _HEADER.size or (len(data) - _HEADER.size) % _RECORD.size:
+            self.logger.warning('Ignoring broken snapshot "%s".', self.path)
+            return
+        magic, fingerprint = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            self.logger.warning('Ignoring snapshot "%s" of unknown format.', self.path)
+            return
+        self._is_same_filters = fingerprint == self.fingerprint
+        self._previous = {user_id: (cheap, full, matched) for user_id, cheap, full, matched
+                          in _RECORD.iter_unpack(memoryview(data)[_HEADER.size:])}
+
+
+def fingerprint(*values):
+    """ 64-bit hash of a sequence of strings/numbers/None """
+    data = '\x1f'.join('' if value is None else str(value) for value in values)
+    return int.from_bytes(hashlib.blake2b(data.encode('utf-8', 'surrogatepass'),
+                                          digest_size=8).digest(), 'little')
+
+
+def cheap_hash(user):
+    """ Hash of the exported fields returned among chat participants.
+        :param user: telethon.tl.types.User or UserRecord object
+    """
+    return fingerprint(user.id, user.first_name, user.last_name, user.username, user.phone)
+
+
+def full_hash(record):
+    """ Hash of all exported fields of UserRecord. See common.extract_user_data() """
+    return fingerprint(record.id, record.first_name, record.last_name, record.username,
+                       record.phone, record.about)
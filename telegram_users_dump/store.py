@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Persistent searchable store of dumped profiles and chat memberships. """
+
+import re
+import time
+import sqlite3
+import logging
+from telegram_users_dump.user_record import UserRecord
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id          INTEGER PRIMARY KEY,
+    access_hash INTEGER,
+    username    TEXT,
+    first_name  TEXT,
+    last_name   TEXT,
+    phone       TEXT,
+    about       TEXT,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_username ON users (username COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS users_phone ON users (phone);
+CREATE TABLE IF NOT EXISTS chats (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL,
+    dumped_at   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    chat_id     INTEGER NOT NULL,
+    user_id     INTEGER NOT NULL,
+    seen_at     REAL NOT NULL,
+    PRIMARY KEY (chat_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS members_user_id ON members (user_id);
+CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+    INSERT INTO users_fts (rowid, username, first_name, last_name, about)
+    VALUES (new.id, new.username, new.first_name, new.last_name, new.about);
+END;
+CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+    INSERT INTO users_fts (users_fts, rowid, username, first_name, last_name, about)
+    VALUES ('delete', old.id, old.username, old.first_name, old.last_name, old.about);
+END;
+CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE ON users BEGIN
+    INSERT INTO users_fts (users_fts, rowid, username, first_name, last_name, about)
+    VALUES ('delete', old.id, old.username, old.first_name, old.last_name, old.about);
+    INSERT INTO users_fts (rowid, username, first_name, last_name, about)
+    VALUES (new.id, new.username, new.first_name, new.last_name, new.about);
+END;
+"""
+
+# Full-text index of bios and names. The trigram tokenizer (SQLite 3.34+)
+# matches any substring of 3+ characters, so regex filters can be narrowed down
+# by the literals they contain. Older SQLite falls back to word tokens.
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5 (
+    username, first_name, last_name, about,
+    content='users', content_rowid='id', tokenize='{}'
+);
+"""
+
+_UPSERT_USER = """
+INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    access_hash = excluded.access_hash, username = excluded.username,
+    first_name = excluded.first_name, last_name = excluded.last_name,
+    phone = excluded.phone, about = excluded.about, updated_at = excluded.updated_at
+"""
+
+# FTS columns searched for -f patterns of each field
+_FTS_COLUMNS = {
+    'about': 'about',
+    'username': 'username',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'name': '{first_name last_name}',
+}
+
+
+class ProfileStore:
+    """ SQLite store every dump writes fetched profiles into.
+
+        It keeps the exported fields of users, which chats they were seen in,
+        a full-text index of bios and names, and indexes on username and phone.
+        `query` command searches it without touching the network.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        """ constructor
+            :param path:       Path to the SQLite database file
+            :param batch_size: Number of pending updates written in one transaction
+        """
+        self.logger = logging.getLogger(__name__)
+        self.batch_size = batch_size
+        self._pending_users = []
+        self._pending_members = []
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        try:
+            self._db.executescript(_FTS_SCHEMA.format('trigram'))
+        except sqlite3.OperationalError:
+            self._db.executescript(_FTS_SCHEMA.format('unicode61 remove_diacritics 2'))
+        self._db.executescript(_SCHEMA)
+        fts_sql = self._db.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'users_fts'").fetchone()[0]
+        self.is_substring_index = 'trigram' in fts_sql
+
+    def add_chat(self, chat_id, name):
+        """ Registers a dumped chat
+            :param chat_id: Peer id of the chat
+            :param name:    Name of the chat as specified by user
+        """
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO chats VALUES (?, ?, ?)',
+                             (chat_id, name, time.time()))
+
+    def put(self, record, chat_id=None):
+        """ Stores a fetched profile
+            :param record:  UserRecord object
+            :param chat_id: Peer id of the chat the user is a member of
+        """
+        now = time.time()
+        self._pending_users.append((record.id, record.access_hash, record.username,
+                                    record.first_name, record.last_name, record.phone,
+                                    record.about, now))
+        if chat_id is not None:
+            self._pending_members.append((chat_id, record.id, now))
+        if len(self._pending_users) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Writes pending updates in one transaction """
+        with self._db:
+            if self._pending_users:
+                self._db.executemany(_UPSERT_USER, self._pending_users)
+                self._pending_users.clear()
+            if self._pending_members:
+                self._db.executemany('INSERT OR REPLACE INTO members VALUES (?, ?, ?)',
+                                     self._pending_members)
+                self._pending_members.clear()
+
+    def close(self):
+        """ Flushes pending updates and closes the database """
+        self.flush()
+        self._db.close()
+
+    def find_chat(self, name):
+        """ Returns peer id of a stored chat by its name or id, or None """
+        row = self._db.execute('SELECT id FROM chats WHERE name = ? OR CAST(id AS TEXT) = ?'
+                               ' ORDER BY dumped_at DESC', (name, name)).fetchone()
+        return row[0] if row is not None else None
+
+    def search(self, fts_query=None, chat_id=None):
+        """ Iterates over stored profiles
+            :param fts_query: FTS5 query the profiles have to match or None
+            :param chat_id:   Peer id of the chat the users have to be members of or None
+
+            :return: Iterator of UserRecord objects
+            :raises ValueError: if the FTS5 query is invalid
+        """
+        sql = 'SELECT users.id, users.access_hash, users.username, users.first_name,' \
+              ' users.last_name, users.phone, users.about FROM users'
+        conditions = []
+        params = []
+        if fts_query:
+            sql += ' JOIN users_fts ON users_fts.rowid = users.id'
+            conditions.append('users_fts MATCH ?')
+            params.append(fts_query)
+        if chat_id is not None:
+            conditions.append('users.id IN (SELECT user_id FROM members WHERE chat_id = ?)')
+            params.append(chat_id)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY users.id'
+        try:
+            for row in self._db.execute(sql, params):
+                yield UserRecord(*row)
+        except sqlite3.OperationalError as ex:
+            raise ValueError('Invalid search query. {}'.format(ex))
+
+    def prefilter(self, pattern_filter):
+        """ Builds an FTS5 query that matches a superset of the users
+            the include patterns of pattern_filter match.
+            :return: FTS5 query or None if the patterns can't be narrowed down,
+                     and every stored profile has to be tested
+        """
+        if not pattern_filter.include or not self.is_substring_index:
+            return None
+        terms = []
+        for _, field, regex in pattern_filter.include_patterns():
+            column = _FTS_COLUMNS.get(field)
+            literal = _required_literal(regex) if column is not None else None
+            if literal is not None and field == 'name':
+                # The name is searched as first and last names joined with a space,
+                # the index has them apart
+                literal = max(literal.split(' '), key=len)
+            if literal is None or len(literal) < 3:
+                return None
+            terms.append('{} : "{}"'.format(column, literal.replace('"', '""')))
+        return ' OR '.join(terms)
+
+
+def _required_literal(regex):
+    """ Returns the longest run of 3+ literal characters every match of regex
+        contains, or None
+    """
+    if regex.flags & re.VERBOSE:
+        return None
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    best = ''
+    run = []
+    for op, value in list(parsed) + [(None, None)]:
+        if op == sre_parse.LITERAL:
+            run.append(chr(value))
+            continue
+        if len(run) > len(best):
+            best = ''.join(run)
+        run = []
+        if op == sre_parse.BRANCH:
+            # A top level alternation: any of the branches may match
+            return None
+    # Trigram tokens: shorter literals can't be searched for
+    return best if len(best.strip()) >= 3 else None
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Offline search of the profile store written by dumps with --store. """
+
+import sys
+import sqlite3
+import logging
+from telegram_users_dump.exceptions import DumpingError
+from telegram_users_dump.exporter_context import ExporterContext
+from telegram_users_dump.output_writer import OutputWriter
+from telegram_users_dump.pattern_filter import PatternFilter
+from telegram_users_dump.store import ProfileStore
+
+
+class StoreQuery:
+    """ Runs filters and an exporter against the profile store.
+
+        The full-text index narrows the search down to profiles that contain
+        the literal parts of the include patterns, then the patterns are
+        tested exactly like in a dump. Patterns without such parts
+        (e.g. phone: ones or ^.{5}$) make it test every stored profile.
+    """
+
+    def __init__(self, settings, exporter):
+        """ constructor
+            :param settings: QuerySettings object
+            :param exporter: Exporter object the found profiles are written with
+        """
+        self.logger = logging.getLogger(__name__)
+        self.settings = settings
+        self.exporter = exporter
+
+    def run(self):
+        """ Searches the store and writes the found profiles.
+            :return: Number of users written
+        """
+        try:
+            pattern_filter = PatternFilter.from_settings(self.settings)
+        except OSError as ex:
+            raise DumpingError('Failed to read patterns file "{}". {}'.format(
+                self.settings.patterns_file, ex.strerror))
+        try:
+            store = ProfileStore(self.settings.store_file)
+        except sqlite3.Error as ex:
+            raise DumpingError('Failed to open store "{}". {}'.format(
+                self.settings.store_file, ex))
+        try:
+            return self._query(store, pattern_filter)
+        except sqlite3.Error as ex:
+            raise DumpingError('Failed to read store "{}". {}'.format(
+                self.settings.store_file, ex))
+        finally:
+            store.close()
+
+    def _query(self, store, pattern_filter):
+        chat_id = None
+        if self.settings.chat:
+            chat_id = store.find_chat(self.settings.chat)
+            if chat_id is None:
+                raise DumpingError('Chat "{}" has not been dumped into the store.'.format(
+                    self.settings.chat))
+        terms = [term for term in (self.settings.match, store.prefilter(pattern_filter))
+                 if term]
+        fts_query = ' AND '.join('({})'.format(term) for term in terms)
+        self.logger.debug('Full-text query: %s', fts_query or None)
+
+        exporter_context = ExporterContext()
+        exporter_context.has_matches_column = pattern_filter.is_multi_pattern
+        if self.settings.out_file:
+            writer = OutputWriter(self.settings.out_file, self.exporter, exporter_context)
+            try:
+                writer.open()
+            except OSError as ex:
+                raise DumpingError('Output file path "{}" is invalid. {}'.format(
+                    self.settings.out_file, ex.strerror))
+        else:
+            writer = _StdoutWriter(self.exporter, exporter_context)
+
+        found = 0
+        try:
+            for record in store.search(fts_query, chat_id):
+                matched_patterns = pattern_filter.match(record)
+                if matched_patterns is None:
+                    continue
+                exporter_context.matched_patterns = matched_patterns
+                writer.write(self.exporter.format(record, exporter_context))
+                found += 1
+                if found == self.settings.limit:
+                    break
+        except ValueError as ex:
+            raise DumpingError(str(ex))
+        finally:
+            try:
+                writer.commit()
+            except OSError as ex:
+                raise DumpingError("Exporting to a final file failed.") from ex
+        return found
+
+
+class _StdoutWriter(OutputWriter):
+    """ OutputWriter that streams rows to the standard output """
+
+    def __init__(self, exporter, exporter_context):
+        super().__init__('<stdout>', exporter, exporter_context)
+        self._file = sys.stdout
+        exporter.begin_final_file(self._file, exporter_context)
+
+    def commit(self, is_complete=False):
+        self.flush()
+        end_final_file = getattr(self.exporter, 'end_final_file', None)
+        if end_final_file is not None:
+            end_final_file(self._file, self.exporter_context)
+        self._file.flush()
@@ -6,26 +6,49 @@
 
 import os
 import sys
+import math
+import time
+import asyncio
 import logging
+import sqlite3
 import re
-from joblib import Parallel, delayed
-from time import sleep
 from collections import deque
-from telethon.tl.types import ChannelParticipantsSearch
+from datetime import timedelta
 from telegram_users_dump.exceptions import DumpingError
 from telegram_users_dump.utils import sprint
 from getpass import getpass
-import codecs
 from telethon import TelegramClient, sync # pylint: disable=unused-import
-from telethon.errors import (FloodWaitError,
+from telethon.errors import (RPCError,
                              SessionPasswordNeededError,
                              UsernameNotOccupiedError,
                              UsernameInvalidError)
-from telethon import functions, types
 from telethon.tl.functions.contacts import ResolveUsernameRequest
-from telegram_users_dump.utils import JOIN_CHAT_PREFIX_URL, ein
+from telethon.utils import get_peer_id, get_display_name
+from telegram_users_dump.utils import JOIN_CHAT_PREFIX_URL
 from telegram_users_dump.exporter_context import ExporterContext
 from telegram_users_dump.progress_bar import ProgressBar
+from telegram_users_dump.fetcher import FullUserFetcher
+from telegram_users_dump.participants import ParticipantEnumerator
+from telegram_users_dump.rate_limiter import RateLimiter
+from telegram_users_dump.output_writer import OutputWriter, NullWriter
+from telegram_users_dump.checkpoint import Checkpoint
+from telegram_users_dump.user_cache import UserCache, SessionUserCache
+from telegram_users_dump.store import ProfileStore
+from telegram_users_dump.participant_filter import ParticipantFilter
+from telegram_users_dump.pattern_filter import PatternFilter
+from telegram_users_dump.entity_cache import EntityCache, is_named
+from telegram_users_dump.snapshot import Snapshot, fingerprint, REMOVED
+from telegram_users_dump.user_record import UserRecord
+from telegram_users_dump.accounts import Account
+from telegram_users_dump.metrics import Metrics, MetricsReporter
+from telegram_users_dump.ordering import likely_first
+from telegram_users_dump.sampling import ParticipantSample, wilson_interval
+
+# Extension of the checkpoint journal added to the resulting file name
+CHECKPOINT_FILE_EXT = '.checkpoint'
+
+# Extension of the cache of resolved chats added to the session name
+ENTITY_CACHE_FILE_EXT = '.entities.json'
 
 
 class TelegramDumper(TelegramClient):
@@ -35,6 +58,7 @@ class TelegramDumper(TelegramClient):
         self.logger = logging.getLogger(__name__)
         self.logger.info('Initializing session...')
         super().__init__(session_user_id, settings.api_id, settings.api_hash, timeout=40, proxy=None)
+        self.session_user_id = session_user_id
 
         # Settings as specified by user or defaults or from metadata
         self.settings = settings
@@ -47,47 +71,112 @@ class TelegramDumper(TelegramClient):
 
         # The context that will be passed to the exporter
         self.exporter_context = ExporterContext()
+        self.exporter_context.is_delta_mode = settings.is_delta_mode
 
         # The number of messages written into a resulting file de-facto
         self.output_total_count = 0
 
+        # time.monotonic() the run has to stop at (--time-budget) or None
+        self.deadline = None
+
+        # Counters and latency histograms of requests and pipeline stages
+        self.metrics = Metrics()
+        self.metrics_reporter = None
+        if settings.stats_file:
+            self.metrics_reporter = MetricsReporter(self.metrics, settings.stats_file,
+                                                    settings.stats_format, settings.stats_interval)
+            self.metrics_reporter.collectors.append(self._collect_metrics)
+
+        # Schedules full-profile requests and absorbs flood waits
+        self.rate_limiter = RateLimiter(rate=min(5.0, settings.max_rate),
+                                        max_rate=settings.max_rate,
+                                        metrics=self.metrics, account=settings.phone_num)
+
+        # Accounts sending full-profile requests. Worker accounts are added on connect.
+        self.accounts = [Account(self, self.rate_limiter, settings.phone_num, is_primary=True)]
+
+        # Optional persistent cache of full user profiles
+        self.user_cache = None
+        if settings.cache_file:
+            self.user_cache = UserCache(settings.cache_file,
+                                        ttl=settings.cache_ttl * 3600,
+                                        max_entries=settings.cache_size)
+        # Chats resolved by previous runs. Stored next to the session file.
+        session_file = getattr(self.session, 'filename', None)
+        self.entity_cache = EntityCache(
+            os.path.splitext(session_file)[0] + ENTITY_CACHE_FILE_EXT if session_file else None)
+
+        # Users who are members of several dumped chats are fetched only once
+        if len(settings.chats) > 1:
+            self.user_cache = SessionUserCache(self.user_cache)
+
     def run(self):
         """ Dumps all desired chat messages into a file """
 
         ret_code = 0
         try:
             self._init_connect()
-            try:
-                channel = self._getChannel()
-            except ValueError as ex:
-                ret_code = 1
-                self.logger.error('%s', ex,
-                                  exc_info=self.logger.level > logging.INFO)
-                return
-            # Fetch history in chunks and save it into a resulting file
-            self._do_dump(channel)
-            
-        except DumpingError as ex:
-            self.logger.error('%s', ex, exc_info=self.logger.level > logging.INFO)
-            ret_code = 1
+            self._init_workers()
+            ret_code = self._dump_chats()
         except KeyboardInterrupt:
             sprint("Received a user's request to interrupt, stopping…")
             ret_code = 1
         except Exception as ex:
             self.logger.error('Uncaught exception ocurred. %s', ex, exc_info=self.logger.level > logging.INFO)
+            ret_code = 1
         finally:
-            self.logger.debug('Make sure there are no temp files left undeleted.')
-            # Clear temp files if any
-            while self.temp_files_list:
-                try:
-                    os.remove(self.temp_files_list.pop().name)
-                except Exception:  # pylint: disable=broad-except
-                    pass
+            self._close()
 
         sprint('{} users were successfully written in the resulting file. Done!'
                .format(self.output_total_count))
         return ret_code
 
+    def _dump_chats(self):
+        """ Dumps the chats of current settings, each into its resulting file
+            :return: 0 if all chats have been dumped, 1 otherwise
+        """
+        ret_code = 0
+        self.deadline = None
+        if self.settings.time_budget:
+            self.deadline = time.monotonic() + self.settings.time_budget
+        channels = self._resolve_chats([target.chat_name for target in self.settings.chats])
+        for target in self.settings.chats:
+            if target.chat_name not in channels:
+                ret_code = 1
+                self.logger.error('Failed to resolve dialogue/chat name "%s".',
+                                  target.chat_name)
+                continue
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                sprint('Time budget is over. Chat "{}" is skipped.'.format(target.chat_name))
+                continue
+            # Fetch users and save them into a resulting file.
+            # A failed chat doesn't stop the rest of the batch.
+            try:
+                self._do_dump(channels[target.chat_name], target)
+            except DumpingError as ex:
+                self.logger.error('%s', ex, exc_info=self.logger.level > logging.INFO)
+                ret_code = 1
+        return ret_code
+
+    def _close(self):
+        """ Disconnects worker accounts and flushes caches and stats """
+        for account in self.accounts[1:]:
+            account.client.disconnect()
+        if self.metrics_reporter is not None:
+            self.metrics_reporter.report()
+        if self.user_cache is not None:
+            self.user_cache.close()
+        self._remove_temp_files()
+
+    def _remove_temp_files(self):
+        """ Removes temp files of resulting files that haven't been committed """
+        self.logger.debug('Make sure there are no temp files left undeleted.')
+        while self.temp_files_list:
+            try:
+                os.remove(self.temp_files_list.pop().name)
+            except Exception:  # pylint: disable=broad-except
+                pass
+
     def _init_connect(self):
         """ Connect to the Telegram server and Authenticate. """
         sprint('Connecting to Telegram servers...')
@@ -110,12 +199,83 @@ class TelegramDumper(TelegramClient):
                                  "Please enter your password: ")
                     self_user = self.sign_in(password=pw)
 
-    def _getChannel(self):
-        """ Returns telethon.tl.types.Channel object resolved from chat_name
-            at Telegram server
+    def _init_workers(self):
+        """ Connects and authenticates extra accounts specified by user.
+            An account that fails to connect is left out.
+        """
+        for phone in self.settings.worker_phones:
+            sprint('Connecting worker account {}...'.format(phone))
+            # Sessions of worker accounts are stored next to the main one
+            session = '{}.{}'.format(self.session_user_id, phone.lstrip('+'))
+            client = TelegramClient(session, self.settings.api_id, self.settings.api_hash,
+                                    timeout=40, proxy=None)
+            try:
+                client.start(phone=phone)
+            except (RPCError, OSError, ValueError) as ex:
+                self.logger.error('Failed to connect worker account %s. %s', phone, ex)
+                client.disconnect()
+                continue
+            self.accounts.append(Account(
+                client, RateLimiter(rate=min(5.0, self.settings.max_rate),
+                                    max_rate=self.settings.max_rate,
+                                    metrics=self.metrics, account=phone), phone))
+
+    def _resolve_chats(self, names):
+        """ Resolves chat names at Telegram server.
+            Names that are neither invitation links nor @-names are looked up
+            in one pass over the logged-in user's dialogs.
+
+            :param names: List of chat names as specified by user
+
+            :return dict of name -> telethon.tl.types.Channel (or other entity) object.
+                    Names that failed to resolve are missing.
+        """
+        resolved = {}
+        # Dialog search key -> name as specified by user
+        pending = {}
+        for name in names:
+            peer = self._resolve_cached_chat(name) or self._resolve_chat(name)
+            if peer is not None:
+                resolved[name] = peer
+                self.entity_cache.add(peer, alias=name)
+            else:
+                pending[name[1:] if name.startswith('@') else name] = name
+
+        if pending:
+            for key, peer in self._find_in_dialogs(list(pending)).items():
+                resolved[pending[key]] = peer
+                self.entity_cache.add(peer, alias=pending[key])
+        self.entity_cache.save()
+        return resolved
+
+    def _resolve_cached_chat(self, name):
+        """ Returns entity object resolved from the cache of resolved chats.
+            A stale entry is dropped and None is returned. An entry is stale
+            if the chat is gone or is no longer called name (invitation links
+            can't be checked and are trusted).
+        """
+        peer = self.entity_cache.get(name)
+        if peer is None:
+            return None
+        try:
+            # One cheap request instead of a dialogs scan
+            entity = self.get_entity(peer)
+        except (ValueError, RPCError) as ex:
+            self.logger.debug('Cached entry of "%s" is stale. %s', name, ex)
+            self.entity_cache.remove(name)
+            return None
+        if not name.startswith(JOIN_CHAT_PREFIX_URL) and not is_named(entity, name):
+            self.logger.debug('Cached entry of "%s" is stale. The chat is called "%s" now.',
+                              name, get_display_name(entity))
+            self.entity_cache.remove(name)
+            return None
+        sprint('Chat name "{}" resolved from cache into channel id={}'.format(name, entity.id))
+        return entity
+
+    def _resolve_chat(self, name):
+        """ Returns telethon.tl.types.Channel object resolved from invitation link
+            or @-name at Telegram server. None if name is neither of them or failed.
         """
-        name = self.settings.chat_name
-
         # For private channуls try to resolve channel peer object from its invitation link
         # Note: it will only work if the login user has already joined the private channel.
         # Otherwise, get_entity will throw ValueError
@@ -129,140 +289,422 @@ class TelegramDumper(TelegramClient):
                     return peer
             except ValueError as ex:
                 self.logger.debug('Failed to resolve "%s" as an invitation link. %s',
-                                  self.settings.chat_name,
+                                  name,
                                   ex,
                                   exc_info=self.logger.level > logging.INFO)
 
         if name.startswith('@'):
-            name = name[1:]
             self.logger.debug('Trying ResolveUsernameRequest().')
             try:
-                peer = self(ResolveUsernameRequest(name))
+                peer = self(ResolveUsernameRequest(name[1:]))
                 if peer.chats is not None and peer.chats:
                     sprint('Chat name "{}" resolved into channel id={}'.format(
-                        name, peer.chats[0].id))
+                        name[1:], peer.chats[0].id))
                     return peer.chats[0]
                 if peer.users is not None and peer.users:
                     sprint('User name "{}" resolved into channel id={}'.format(
-                        name, peer.users[0].id))
+                        name[1:], peer.users[0].id))
                     return peer.users[0]
             except (UsernameNotOccupiedError, UsernameInvalidError) as ex:
                 self.logger.debug('Failed to resolve "%s" as @-chat-name. %s',
-                                  self.settings.chat_name,
+                                  name,
                                   ex,
                                   exc_info=self.logger.level > logging.INFO)
+        return None
 
-        # Search in dialogs first, this way we will find private groups and
-        # channels.
-        self.logger.debug('Fetch loggedin user`s dialogs')
-        dialogs_count = self.get_dialogs(0).total
-        self.logger.info('%s user`s dialogs found', dialogs_count)
-        dialogs = self.get_dialogs(limit=None)
-        self.logger.debug('%s dialogs fetched.', len(dialogs))
-        for dialog in dialogs:
-            if dialog.name == name:
-                sprint('Dialog title "{}" resolved into channel id={}'.format(
-                    name, dialog.entity.id))
-                return dialog.entity
-            if hasattr(dialog.entity, 'username') and dialog.entity.username == name:
-                sprint('Dialog username "{}" resolved into channel id={}'.format(
-                    name, dialog.entity.id))
-                return dialog.entity
-            if name.startswith('@') and dialog.entity.username == name[1:]:
-                sprint('Dialog username "{}" resolved into channel id={}'.format(
-                    name, dialog.entity.id))
-                return dialog.entity
-        self.logger.debug('Specified chat name was not found among dialogs.')
-
-        raise ValueError('Failed to resolve dialogue/chat name "{}".'.format(name))
-
-    def _do_dump(self, channel):
-        """ Retrieves users and save them in-memory 'buffer'.
-            Then writes them in resulting file.
-
-             :param peer: Chat/Channel object that contains the message history of interest
+    def _find_in_dialogs(self, names):
+        """ Searches dialogs by title or username.
+            This way we will find private groups and channels.
+            Dialogs are walked page by page until all names are found.
+            Every dialog seen is remembered in the cache of resolved chats.
+
+            :param names: List of dialog titles or usernames
+
+            :return dict of name -> dialog entity for names that were found
+        """
+        found = {}
+        dialogs_count = 0
+        self.logger.debug('Walk loggedin user`s dialogs')
+        for dialog in self.iter_dialogs():
+            dialogs_count += 1
+            self.entity_cache.add(dialog.entity)
+            for name in names:
+                if name in found:
+                    continue
+                if dialog.name == name:
+                    sprint('Dialog title "{}" resolved into channel id={}'.format(
+                        name, dialog.entity.id))
+                    found[name] = dialog.entity
+                elif getattr(dialog.entity, 'username', None) == name:
+                    sprint('Dialog username "{}" resolved into channel id={}'.format(
+                        name, dialog.entity.id))
+                    found[name] = dialog.entity
+            if len(found) == len(names):
+                break
+        self.logger.debug('%s dialogs fetched.', dialogs_count)
+        if len(found) < len(names):
+            self.logger.debug('Some of specified chat names were not found among dialogs.')
+        return found
+
+    def _do_dump(self, channel, target):
+        """ Retrieves users and streams the matching ones into the resulting file.
+
+             :param channel: Chat/Channel object that contains the users of interest
+             :param target:  ChatTarget with the chat name and its resulting file
 
              :return  Number of files that were saved into resulting file
         """
-        self.msg_count_to_process = sys.maxsize
+        self.msg_count_to_process = self.settings.limit or sys.maxsize
 
-        self._check_preconditions()
+        if len(self.settings.chats) > 1:
+            sprint('Dumping chat "{}"'.format(target.chat_name))
+        is_output = not self.settings.is_sample_mode or self.settings.is_write_sample
+        if is_output:
+            self._check_preconditions(target)
 
-        # Current buffer of messages, that will be batched into a temp file
-        # or otherwise written directly into the resulting file if there are too few of them
-        # to form a batch of size 1000.
-        buffer = deque()
         filter_flags = re.IGNORECASE if self.settings.ignore_case else 0
-        pattern = re.compile(self.settings.filter, filter_flags)
-
+        pattern_filter = self._pattern_filter()
+        # Tell which of several patterns a user matched
+        self.exporter_context.has_matches_column = pattern_filter.is_multi_pattern
+        where = ParticipantFilter(self.settings.where, filter_flags) \
+            if self.settings.where else None
+
+        snapshot = None
+        if target.snapshot_file:
+            snapshot = Snapshot(target.snapshot_file, fingerprint(
+                pattern_filter.include, pattern_filter.exclude,
+                self.settings.ignore_case, self.settings.where))
+
+        store = self._open_store(channel, target)
+        if is_output:
+            writer, processed = self._open_output(target)
+        else:
+            writer, processed = NullWriter(), set()
         # process users
+        is_complete = False
         try:
-            all_participants = self.get_participants(channel, filter=ChannelParticipantsSearch(''), aggressive=True)
-            users_size = len(all_participants)
-            sprint("Found users total: {}".format(users_size))
-
-            users_count = 0
-            found = 0
-            bar = ProgressBar("Processed users", users_size)
-            bar.startProgress()
-            for user in all_participants:
-                full = self(functions.users.GetFullUserRequest(user))
-                if pattern.search(ein(full.about)):
-                    user_dump_str = self.exporter.format(full, self.exporter_context)
-                    buffer.append(user_dump_str)
-                    found += 1
-                users_count += 1
-                bar.progress(users_count, found)
-            bar.endProgress(found)
+            _, is_complete = self.loop.run_until_complete(self._process_users(
+                channel, pattern_filter, where, processed, writer, snapshot, store))
         except RuntimeError as ex:
             sprint('Fetching users from server failed. ' + str(ex))
             sprint('Warn: The resulting file will contain partial/incomplete data.')
-
-        sprint('Writing results into an output file.')
+        finally:
+            # Whatever has been fetched so far goes into the resulting file.
+            # The checkpoint journal is kept only if there is something to continue.
+            try:
+                writer.commit(is_complete)
+                if store is not None:
+                    store.close()
+            except OSError as ex:
+                raise DumpingError("Dumping to a final file failed.") from ex
+            except sqlite3.Error as ex:
+                raise DumpingError('Failed to write store "{}". {}'.format(
+                    self.settings.store_file, ex))
+            self.output_total_count += writer.count
+        if snapshot is not None:
+            try:
+                snapshot.save()
+            except OSError as ex:
+                raise DumpingError('Failed to save snapshot "{}". {}'.format(
+                    target.snapshot_file, ex.strerror))
+
+    def _open_store(self, channel, target):
+        """ Opens the profile store given by --store and registers the chat in it
+            :return: ProfileStore object or None
+        """
+        if not self.settings.store_file:
+            return None
         try:
-            self._write_final_file(buffer)
+            store = ProfileStore(self.settings.store_file)
+            store.add_chat(get_peer_id(channel), target.chat_name)
+        except sqlite3.Error as ex:
+            raise DumpingError('Failed to open store "{}". {}'.format(
+                self.settings.store_file, ex))
+        return store
+
+    def _pattern_filter(self):
+        """ Compiles bio patterns given by -f, --exclude and --patterns-file """
+        try:
+            return PatternFilter.from_settings(self.settings)
         except OSError as ex:
-            raise DumpingError("Dumping to a final file failed.") from ex
+            raise DumpingError('Failed to read patterns file "{}". {}'.format(
+                self.settings.patterns_file, ex.strerror))
+
+    async def _process_users(self, channel, pattern_filter, where, processed, writer,
+                             snapshot=None, store=None):
+        """ Streams chat participants, fetches full profiles of them concurrently,
+            filters them and streams formatted matches into writer.
+            In delta mode only the difference with the snapshot is written.
+
+            :param channel:   Chat/Channel object
+            :param pattern_filter: PatternFilter applied to full profiles
+            :param where:          ParticipantFilter applied before fetching full profiles or None
+            :param processed:      Set of ids of users to skip
+            :param writer:         OutputWriter of the resulting file
+            :param snapshot:       Snapshot of the previous dump or None
+            :param store:          ProfileStore every fetched profile is saved into or None
+
+            :return (number of users matched the filter,
+                     whether the dump went through all the users) tuple
+        """
+        # Let flood waits reach the rate limiter instead of being slept through
+        # inside telethon, so it can adapt the request rate.
+        # Don't let the session store every participant it sees. Users are
+        # requested by the objects listing returns, not looked up by id.
+        clients = [account.client for account in self.accounts]
+        client_settings = [(client.flood_sleep_threshold,
+                            getattr(client.session, 'save_entities', None))
+                           for client in clients]
+        for client, (_, save_entities) in zip(clients, client_settings):
+            client.flood_sleep_threshold = 0
+            if save_entities is not None:
+                client.session.save_entities = False
+        # Background tasks: the metrics reporter and worker accounts
+        # learning their access hashes of the participants
+        loaders = []
+        if self.metrics_reporter is not None:
+            loaders.append(asyncio.ensure_future(self.metrics_reporter.run()))
+        metrics = self.metrics
+        chat_id = get_peer_id(channel) if store is not None else None
+        skipped = 0
+        filtered_out = 0
+        found = 0
+        try:
+            if len(self.accounts) > 1:
+                entity = await self.get_entity(channel)
+                loaders += [asyncio.ensure_future(account.load_access_hashes(
+                    entity, self.settings.concurrency)) for account in self.accounts[1:]]
+            enumerator = ParticipantEnumerator(self, self.rate_limiter,
+                                               self.settings.concurrency)
+            users_size = await enumerator.count(channel)
+            sprint("Found users total: {}".format(users_size))
+            if processed:
+                sprint("Continuing the dump. Users processed before: {}".format(len(processed)))
 
-    def _check_preconditions(self):
+            async def selected_users():
+                """ Participants that need a full profile request """
+                nonlocal skipped, filtered_out
+                participants = enumerator.enumerate(channel)
+                try:
+                    async for user in participants:
+                        metrics.inc('participants_listed_total')
+                        if user.id in processed:
+                            skipped += 1
+                            continue
+                        # Cheap first stage filter: only survivors cost a full profile request
+                        if where is not None:
+                            started = time.perf_counter()
+                            is_selected = where(user)
+                            metrics.observe('filter_seconds', time.perf_counter() - started,
+                                            stage='where')
+                            if not is_selected:
+                                filtered_out += 1
+                                continue
+                        if snapshot is not None and snapshot.is_unchanged(user):
+                            continue
+                        yield user
+                finally:
+                    await participants.aclose()
+
+            fetcher = FullUserFetcher(self.accounts, self.settings.concurrency,
+                                      self.user_cache)
+            users = selected_users()
+            sample = None
+            if self.settings.is_sample_mode:
+                sample = ParticipantSample(self.settings.sample_size or math.ceil(
+                    self.settings.sample_fraction * users_size))
+                sprint('Sampling {} participants...'.format(sample.size))
+                users = sample.draw(users)
+            if self.settings.order == 'likely':
+                users = likely_first(users)
+            limit = self.settings.limit
+            users_count = 0
+
+            async def write_matches():
+                """ Writes fetched users that match the filters.
+                    :return: Whether it stopped early having written `limit` users
+                """
+                nonlocal users_count, found
+                records = fetcher.fetch(users)
+                try:
+                    async for record in records:
+                        if store is not None:
+                            store.put(record, chat_id)
+                        started = time.perf_counter()
+                        matched_patterns = pattern_filter.match(record)
+                        metrics.observe('filter_seconds', time.perf_counter() - started,
+                                        stage='pattern')
+                        matched = matched_patterns is not None
+                        self.exporter_context.matched_patterns = matched_patterns
+                        if snapshot is not None:
+                            self.exporter_context.delta_op = snapshot.update(record, matched)
+                            matched = self.exporter_context.delta_op is not None
+                        if matched:
+                            started = time.perf_counter()
+                            row = self.exporter.format(record, self.exporter_context)
+                            metrics.observe('format_seconds', time.perf_counter() - started)
+                            writer.write(row, record.id)
+                            found += 1
+                        else:
+                            writer.mark_processed(record.id)
+                        users_count += 1
+                        if sample is not None:
+                            bar.progress(users_count, found, self.rate_limiter.rate)
+                        else:
+                            bar.progress(users_count + skipped + filtered_out
+                                         + (snapshot.unchanged_count if snapshot else 0),
+                                         found, self.rate_limiter.rate)
+                        if limit and found >= limit:
+                            return True
+                    return False
+                finally:
+                    await records.aclose()
+
+            # Requests in flight are dropped when the dump stops early.
+            # Users written so far are committed, the rest is left for --continue.
+            stop_reason = None
+            bar = ProgressBar("Processed users", min(sample.size, users_size)
+                              if sample is not None else users_size)
+            bar.startProgress()
+            try:
+                try:
+                    if self.deadline is None:
+                        is_stopped = await write_matches()
+                    else:
+                        is_stopped = await asyncio.wait_for(
+                            write_matches(), max(0.0, self.deadline - time.monotonic()))
+                    if is_stopped:
+                        stop_reason = 'Limit of {} users is reached.'.format(limit)
+                except asyncio.TimeoutError:
+                    stop_reason = 'Time budget is over.'
+                if stop_reason is None and snapshot is not None:
+                    # Removed users have no profile anymore, only the id is written
+                    self.exporter_context.delta_op = REMOVED
+                    self.exporter_context.matched_patterns = None
+                    for user_id in snapshot.finish():
+                        writer.write(self.exporter.format(UserRecord(user_id),
+                                                          self.exporter_context))
+                        found += 1
+            finally:
+                # Stops the writer thread of the bar even if the dump failed
+                bar.endProgress(found)
+            if sample is not None:
+                self._report_sample(sample, found, filtered_out)
+            if stop_reason is not None:
+                metrics.inc('stopped_dumps_total')
+                sprint('{} The dump is stopped early.{}'.format(
+                    stop_reason, '' if snapshot is not None
+                    else ' Use --continue to resume it.'))
+        finally:
+            for loader in loaders:
+                loader.cancel()
+            metrics.inc('users_total', skipped, result='skipped')
+            metrics.inc('users_total', filtered_out, result='filtered_out')
+            metrics.inc('users_total', found, result='written')
+            if snapshot is not None:
+                metrics.inc('users_total', snapshot.unchanged_count, result='unchanged')
+            for client, (flood_sleep_threshold, save_entities) in zip(clients, client_settings):
+                client.flood_sleep_threshold = flood_sleep_threshold
+                if save_entities is not None:
+                    client.session.save_entities = save_entities
+        if where is not None:
+            sprint("Users skipped by participant filter: {}".format(filtered_out))
+        if snapshot is not None:
+            sprint("Users unchanged since the snapshot: {}".format(snapshot.unchanged_count))
+        if self.user_cache is not None:
+            sprint('Profiles cache: {} hits, {} misses'.format(
+                self.user_cache.hits, self.user_cache.misses))
+        for account in self.accounts:
+            if account.rate_limiter.flood_waits_count:
+                sprint('{}{} flood waits absorbed. Final request rate: {:.2f} req/s'.format(
+                    account.name + ': ' if len(self.accounts) > 1 else '',
+                    account.rate_limiter.flood_waits_count, account.rate_limiter.rate))
+        if len(self.accounts) > 1:
+            sprint('Requests per account: {}'.format(', '.join(
+                '{} - {}'.format(account.name, account.requests_count)
+                for account in self.accounts)))
+        return found, stop_reason is None
+
+    def _report_sample(self, sample, found, filtered_out):
+        """ Prints the estimated outcome of a full dump of the sampled chat
+            :param sample:       ParticipantSample that has been fetched
+            :param found:        Number of sampled users that matched the filters
+            :param filtered_out: Number of users skipped by participant filter
+        """
+        sampled = min(sample.size, sample.population)
+        sprint('Sampled {} of {} participants{}. Matched: {} ({:.1%})'.format(
+            sampled, sample.population,
+            ' (participant filter skipped {} more)'.format(filtered_out) if filtered_out else '',
+            found, found / sampled if sampled else 0.0))
+        if not sampled:
+            return
+        low, high = wilson_interval(found, sampled, sample.population)
+        sprint('Estimated matches in the chat: {} (95% confidence interval: {} - {})'.format(
+            round(found / sampled * sample.population), math.floor(low * sample.population),
+            math.ceil(high * sample.population)))
+
+        # Latency of full-profile requests and the rate the accounts ended up at
+        latency_sum, requests_count = 0.0, 0
+        for (name, labels), histogram in self.metrics.histograms.items():
+            if name == 'rpc_seconds' and ('method', 'GetFullUserRequest') in labels:
+                latency_sum += histogram.sum
+                requests_count += histogram.count
+        if not requests_count:
+            return
+        throughput = min(
+            len(self.accounts) * self.settings.concurrency * requests_count / latency_sum,
+            sum(account.rate_limiter.rate for account in self.accounts))
+        # Users found in the profiles cache don't cost a request
+        if self.settings.cache_file and self.user_cache.hits + self.user_cache.misses:
+            requests_needed = sample.population * self.user_cache.misses \
+                / (self.user_cache.hits + self.user_cache.misses)
+        else:
+            requests_needed = sample.population
+        sprint('Projected full dump duration: {} ({} full-profile requests, {:.0f} ms '
+               'per request, ~{:.1f} req/s; listing took {:.0f} s)'.format(
+                   timedelta(seconds=round(sample.listing_seconds + requests_needed / throughput)),
+                   round(requests_needed), latency_sum / requests_count * 1000, throughput,
+                   sample.listing_seconds))
+
+    def _collect_metrics(self, metrics):
+        """ Updates gauges before metrics are reported """
+        for account in self.accounts:
+            metrics.set('request_rate', account.rate_limiter.rate, account=account.name)
+            metrics.set('requests_in_flight', account.in_flight, account=account.name)
+        if self.user_cache is not None:
+            metrics.set('cache_hits', self.user_cache.hits)
+            metrics.set('cache_misses', self.user_cache.misses)
+        metrics.set('output_rows', self.output_total_count)
+
+    def _check_preconditions(self, target):
         """ Check preconditions before processing data """
-        out_file_path = self.settings.out_file
-        if os.path.exists(out_file_path):
+        out_file_path = target.out_file
+        if os.path.exists(out_file_path) and not self.settings.is_continue_mode:
             sprint('Warning: The output file already exists.')
             if not self._is_user_confirmed('Are you sure you want to overwrite it? [y/n]'):
                 raise DumpingError("Terminating on user's request...")
-        # Check if output file can be created/overwritten
-        try:
-            with open(out_file_path, mode='w+'):
-                pass
-        except OSError as ex:
-            raise DumpingError('Output file path "{}" is invalid. {}'.format(
-                out_file_path, ex.strerror))
         sprint('Dumping {} users into "{}" file ...'
                 .format('all' if self.msg_count_to_process == sys.maxsize
                         else self.msg_count_to_process, out_file_path))
 
-    def _flush_buffer_into_filestream(self, buffer, file_stream):
-        """ Flush buffer into a file stream """
-        count = 0
-        while buffer:
-            count += 1
-            cur_user = buffer.pop()
-            print(cur_user, file=file_stream)
-        return count
-
-    def _write_final_file(self, buffer):
-        # result_file_mode = 'a' if self.settings.last_message_id > -1 else 'w'
-        with codecs.open(self.settings.out_file, 'w', 'utf-8') as resulting_file:
-            # if self.settings.is_addbom:
-            #     resulting_file.write(codecs.BOM_UTF8.decode())
-
-            # self.exporter.begin_final_file(
-            #     resulting_file, self.exporter_context)
-
-            # flush what's left in the mem buffer into resulting file
-            self.output_total_count += self._flush_buffer_into_filestream(
-                buffer, resulting_file)
+    def _open_output(self, target):
+        """ Opens a streaming writer of the resulting file.
+            Users are written into a temp file which replaces the resulting one
+            once the dump is over. Processed users are journaled into
+            a checkpoint file next to it, so that the dump can be continued.
+
+            :return (writer, set of ids of users processed by the interrupted dump)
+        """
+        checkpoint = Checkpoint(target.out_file + CHECKPOINT_FILE_EXT)
+        writer = OutputWriter(target.out_file, self.exporter, self.exporter_context,
+                              self.temp_files_list, checkpoint, metrics=self.metrics)
+        # Check if output file can be created/overwritten
+        try:
+            processed = writer.open(resume=self.settings.is_continue_mode)
+        except OSError as ex:
+            raise DumpingError('Output file path "{}" is invalid. {}'.format(
+                target.out_file, ex.strerror))
+        return writer, processed
 
     def _is_user_confirmed(self, msg):
         """ Get confirmation from user """
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Persistent local cache of full user profiles. """
+
+import time
+import sqlite3
+import logging
+from telegram_users_dump.user_record import UserRecord
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id          INTEGER PRIMARY KEY,
+    access_hash INTEGER,
+    username    TEXT,
+    first_name  TEXT,
+    last_name   TEXT,
+    phone       TEXT,
+    about       TEXT,
+    fetched_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_accessed_at ON users (accessed_at);
+"""
+
+
+class UserCache:
+    """ SQLite backed cache of full user profiles keyed by user id and access_hash.
+
+        Entries older than `ttl` seconds are considered stale and have to be
+        refetched. When the cache is closed, the least recently used entries
+        above `max_entries` are evicted.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=1000000, batch_size=1000):
+        """ constructor
+            :param path:        Path to the SQLite database file
+            :param ttl:         Time to live of an entry in seconds
+            :param max_entries: Max number of entries kept in the cache
+            :param batch_size:  Number of pending updates written in one transaction
+        """
+        self.logger = logging.getLogger(__name__)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._pending_puts = []
+        self._pending_touches = []
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+
+    def get(self, user):
+        """ Looks the user up in the cache.
+            :param user: telethon.tl.types.User object as returned among chat participants
+
+            :return: UserRecord or None if the entry is missing or stale
+        """
+        row = self._db.execute(
+            'SELECT access_hash, username, first_name, last_name, phone, about, fetched_at'
+            ' FROM users WHERE id = ?', (user.id,)).fetchone()
+        now = time.time()
+        if row is None or row[0] != getattr(user, 'access_hash', None) \
+                or now - row[6] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._pending_touches.append((now, user.id))
+        self._flush_if_needed()
+        return UserRecord(user.id, *row[:6])
+
+    def put(self, record):
+        """ Stores freshly fetched profile
+            :param record: UserRecord object
+        """
+        now = time.time()
+        self._pending_puts.append((record.id, record.access_hash, record.username,
+                                   record.first_name, record.last_name, record.phone,
+                                   record.about, now, now))
+        self._flush_if_needed()
+
+    def flush(self):
+        """ Writes pending updates in one transaction """
+        with self._db:
+            if self._pending_puts:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    self._pending_puts)
+                self._pending_puts.clear()
+            if self._pending_touches:
+                self._db.executemany('UPDATE users SET accessed_at = ? WHERE id = ?',
+                                     self._pending_touches)
+                self._pending_touches.clear()
+
+    def close(self):
+        """ Flushes pending updates, evicts least recently used entries
+            above the size limit and closes the database.
+        """
+        self.flush()
+        with self._db:
+            count = self._db.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    'DELETE FROM users WHERE id IN'
+                    ' (SELECT id FROM users ORDER BY accessed_at LIMIT ?)',
+                    (count - self.max_entries,))
+                self.logger.debug('%s entries evicted from the cache.',
+                                  count - self.max_entries)
+        self._db.close()
+
+    def _flush_if_needed(self):
+        if len(self._pending_puts) + len(self._pending_touches) >= self.batch_size:
+            self.flush()
+
+
+class SessionUserCache:
+    """ In-memory cache of profiles seen during this run, in front of an optional
+        persistent UserCache. Lets a batch of chats fetch the profile of
+        a user who is a member of several of them only once.
+    """
+
+    def __init__(self, persistent_cache=None):
+        """ constructor
+            :param persistent_cache: Optional UserCache consulted on misses
+        """
+        self.persistent_cache = persistent_cache
+        self._profiles = {}
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self):
+        if self.persistent_cache is not None:
+            return self._hits + self.persistent_cache.hits
+        return self._hits
+
+    @property
+    def misses(self):
+        if self.persistent_cache is not None:
+            return self.persistent_cache.misses
+        return self._misses
+
+    def get(self, user):
+        """ Same as UserCache.get() """
+        cached = self._profiles.get(user.id)
+        if cached is not None and cached.access_hash == getattr(user, 'access_hash', None):
+            self._hits += 1
+            return cached
+        if self.persistent_cache is not None:
+            cached = self.persistent_cache.get(user)
+            if cached is not None:
+                self._profiles[user.id] = cached
+                return cached
+        self._misses += 1
+        return None
+
+    def put(self, record):
+        """ Same as UserCache.put() """
+        self._profiles[record.id] = record
+        if self.persistent_cache is not None:
+            self.persistent_cache.put(record)
+
+    def close(self):
+        self._profiles.clear()
+        if self.persistent_cache is not None:
+            self.persistent_cache.close()
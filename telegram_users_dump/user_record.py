@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Lightweight record of a dumped user. """
+
+
+class UserRecord:
+    """ Exported fields of a user.
+
+        Telethon User/UserFull objects carry dozens of attributes and nested
+        TL objects. They are converted into this record as soon as a profile
+        is fetched, so that only the fields exporters need are kept alive
+        in caches and in the pipeline.
+    """
+
+    __slots__ = ('id', 'access_hash', 'username', 'first_name', 'last_name', 'phone', 'about')
+
+    # pylint: disable=too-many-arguments,redefined-builtin
+    def __init__(self, id, access_hash=None, username=None, first_name=None,
+                 last_name=None, phone=None, about=None):
+        self.id = id
+        self.access_hash = access_hash
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.phone = phone
+        self.about = about
+
+    @classmethod
+    def from_full(cls, full):
+        """ Builds a record out of telethon.tl.types.UserFull object """
+        user = full.user
+        return cls(user.id, getattr(user, 'access_hash', None), user.username,
+                   user.first_name, user.last_name, user.phone, full.about)
+
+    def __repr__(self):
+        return 'UserRecord({})'.format(', '.join(
+            '{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of job submission to the dump daemon """
+
+import pytest
+from telethon.sessions import MemorySession
+from telegram_users_dump.chat_dump_settings import DaemonSettings
+from telegram_users_dump.daemon import DumpDaemon
+
+DAEMON_PHONE = '+380501112233'
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    settings = DaemonSettings('daemon', ['-p', DAEMON_PHONE,
+                                         '--socket', str(tmp_path / 'daemon.sock')])
+    return DumpDaemon(MemorySession(), settings, 'job')
+
+
+def test_job_runs_as_daemon_account(daemon, tmp_path):
+    job = daemon._submit({'args': ['-c', '@chat'], 'cwd': str(tmp_path)})
+    assert job.settings.phone_num == DAEMON_PHONE
+    assert job.settings.worker_phones == []
+
+
+@pytest.mark.parametrize('phone_args', [
+    ['-p', '+380504445566'],
+    ['-p+380504445566'],
+    ['--phone', '+380504445566'],
+    ['--phone=+380504445566'],
+])
+def test_job_phone_is_rejected(daemon, tmp_path, phone_args):
+    with pytest.raises(ValueError, match='-p, --profile, --stats and --cache'):
+        daemon._submit({'args': ['-c', '@chat'] + phone_args, 'cwd': str(tmp_path)})
+    assert not daemon.jobs
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the cache of resolved chats """
+
+import logging
+from types import SimpleNamespace
+from telethon import types
+from telegram_users_dump.entity_cache import EntityCache
+from telegram_users_dump.telegram_dumper import TelegramDumper
+
+
+def _channel(channel_id, title, username=None):
+    return types.Channel(id=channel_id, title=title, photo=types.ChatPhotoEmpty(),
+                         date=None, version=0, access_hash=channel_id * 10,
+                         username=username)
+
+
+class _Dumper(TelegramDumper):
+    """ TelegramDumper resolving chats against in-memory channels """
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, entity_cache, channels):
+        self.logger = logging.getLogger(__name__)
+        self.entity_cache = entity_cache
+        self.channels = {channel.id: channel for channel in channels}
+        self.dialogs_walks = 0
+
+    def get_entity(self, entity):
+        return self.channels[entity.channel_id]
+
+    def iter_dialogs(self, *args, **kwargs):
+        self.dialogs_walks += 1
+        return [SimpleNamespace(name=channel.title, entity=channel)
+                for channel in self.channels.values()]
+
+
+def test_cached_title_resolves_while_unchanged():
+    entity_cache = EntityCache(None)
+    entity_cache.add(_channel(1, 'Team'))
+    dumper = _Dumper(entity_cache, [_channel(1, 'Team')])
+    assert dumper._resolve_chats(['Team'])['Team'].id == 1
+    assert dumper.dialogs_walks == 0
+
+
+def test_cached_title_of_renamed_chat_is_dropped():
+    entity_cache = EntityCache(None)
+    entity_cache.add(_channel(1, 'Team'), alias='Team')
+    # Chat 1 was renamed, the title belongs to chat 2 now
+    dumper = _Dumper(entity_cache, [_channel(1, 'Old team'), _channel(2, 'Team')])
+    assert dumper._resolve_chats(['Team'])['Team'].id == 2
+    assert dumper.dialogs_walks == 1
+    assert entity_cache.get('Team').channel_id == 2
+
+
+def test_cached_username_moved_to_another_chat_is_dropped():
+    entity_cache = EntityCache(None)
+    entity_cache.add(_channel(1, 'Team', username='team'))
+    dumper = _Dumper(entity_cache, [_channel(1, 'Team', username='team_old'),
+                                    _channel(2, 'Other', username='team')])
+    dumper._resolve_chat = lambda name: dumper.channels[2]
+    assert dumper._resolve_chats(['@team'])['@team'].id == 2
+    assert entity_cache.get('@team').channel_id == 2
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of PatternFilter """
+
+from telegram_users_dump.pattern_filter import PatternFilter
+from telegram_users_dump.user_record import UserRecord
+
+
+def test_lone_match_all_pattern_filters_nothing():
+    pattern_filter = PatternFilter(['.*'])
+    assert pattern_filter.include == []
+    assert pattern_filter.match(UserRecord(1, about='bar')) == []
+
+
+def test_match_all_pattern_next_to_others_passes_everyone():
+    pattern_filter = PatternFilter(['.*', 'foo'])
+    assert pattern_filter.is_multi_pattern
+    assert pattern_filter.match(UserRecord(1, about='bar')) == ['.*']
+    assert pattern_filter.match(UserRecord(2, about='foo')) == ['.*', 'foo']
+    assert pattern_filter.match(UserRecord(3)) == ['.*']
+
+
+def test_match_all_line_in_patterns_file(tmp_path):
+    patterns_file = tmp_path / 'patterns.txt'
+    patterns_file.write_text('foo\n.*\n!spam\n', encoding='utf-8')
+    pattern_filter = PatternFilter.from_file(str(patterns_file))
+    assert pattern_filter.match(UserRecord(1, about='bar')) == ['.*']
+    assert pattern_filter.match(UserRecord(2, about='spam')) is None